@@ -1,13 +1,31 @@
-from flask import Flask, render_template, request, jsonify, redirect, url_for
+from flask import Flask, render_template, request, jsonify, redirect, url_for, g, make_response, has_request_context, session
+from werkzeug.middleware.proxy_fix import ProxyFix
+import datetime
+import functools
+import math
+import hashlib
+import hmac
 import os
+import re
 import json
-import requests
+import secrets
 import time
-from firebase_admin import credentials, initialize_app, firestore
+from assets import BUILD_URL_PREFIX, responsive_image
+from catalog import Catalog, SearchIndex
+from metrics import Registry, SlowRequestProfiler
+from notifications import NotificationDispatcher, TelegramTransport
+from ratelimit import RateLimiter, Rule, MemoryStore, SqliteStore
+from storage import create_storage, cart_items as list_cart_items
 
 # Initialize Flask app
 app = Flask(__name__, static_folder='static', template_folder='templates')
 
+# Behind Vercel or another reverse proxy, PROXY_COUNT hops of X-Forwarded-For are trusted
+# so request.remote_addr is the visitor's address rather than the proxy's
+PROXY_COUNT = int(os.environ.get('PROXY_COUNT', 0))
+if PROXY_COUNT:
+    app.wsgi_app = ProxyFix(app.wsgi_app, x_for=PROXY_COUNT, x_proto=0)
+
 # Add custom floatformat filter for Jinja2
 def floatformat(value, decimal_places=2):
     try:
@@ -16,23 +34,80 @@ def floatformat(value, decimal_places=2):
         return value
 
 app.jinja_env.filters['floatformat'] = floatformat
+app.jinja_env.globals['responsive_image'] = responsive_image
+
+# Built images are content-hashed (scripts/build_images.py), so they can be cached forever
+@app.after_request
+def cache_built_assets(response):
+    if request.path.startswith(BUILD_URL_PREFIX) and response.status_code == 200:
+        response.headers['Cache-Control'] = 'public, max-age=31536000, immutable'
+    return response
 
 # Initialize Firebase
-firebase_credentials = os.environ.get('FIREBASE_CREDENTIALS')
-if firebase_credentials:
-    cred = credentials.Certificate(json.loads(firebase_credentials))
-else:
-    cred_path = 'forever-zama-firebase-adminsdk.json'
-    if os.path.exists(cred_path):
-        cred = credentials.Certificate(cred_path)
+def init_firestore():
+    from firebase_admin import credentials, initialize_app, firestore
+    firebase_credentials = os.environ.get('FIREBASE_CREDENTIALS')
+    if firebase_credentials:
+        cred = credentials.Certificate(json.loads(firebase_credentials))
     else:
-        raise FileNotFoundError(f"Firebase credentials file '{cred_path}' not found.")
-firebase_app = initialize_app(cred)
-db = firestore.client()
-
-# Clear cart on startup to remove default items
-for doc in db.collection('carts').get():
-    doc.reference.delete()
+        cred_path = 'forever-zama-firebase-adminsdk.json'
+        if os.path.exists(cred_path):
+            cred = credentials.Certificate(cred_path)
+        else:
+            raise FileNotFoundError(f"Firebase credentials file '{cred_path}' not found.")
+    initialize_app(cred)
+    return firestore.client()
+
+# Storage backend: firestore (default), sqlite (SQLITE_PATH) or memory, for local dev and load testing.
+# The Firestore client is only created on first use, and stale carts expire by TTL (see /tasks/expire_carts)
+# rather than being wiped at startup, so a cold start does no storage work at all.
+STORAGE_BACKEND = os.environ.get('STORAGE_BACKEND', 'firestore')
+CART_TTL = int(os.environ.get('CART_TTL_SECONDS', 7 * 24 * 3600))
+storage = create_storage(STORAGE_BACKEND, client_factory=init_firestore, sqlite_path=os.environ.get('SQLITE_PATH'), cart_ttl=CART_TTL)
+
+# Metrics, exposed in Prometheus text format on /metrics
+metrics = Registry()
+REQUEST_LATENCY = metrics.histogram('http_request_duration_seconds', 'Request latency by route', ('route', 'method', 'status'))
+STORAGE_CALLS = metrics.counter('storage_calls', 'Storage backend round-trips by operation', ('backend', 'operation'))
+STORAGE_LATENCY = metrics.histogram('storage_call_duration_seconds', 'Storage backend round-trip latency', ('backend', 'operation'))
+STORAGE_CALLS_PER_REQUEST = metrics.histogram('storage_calls_per_request', 'Storage round-trips made by one request', ('route',), buckets=(0, 1, 2, 3, 4, 5, 10, 25, 50))
+NOTIFICATIONS = metrics.counter('notifications', 'Notification dispatcher events', ('event',))
+NOTIFICATION_LATENCY = metrics.histogram('notification_send_duration_seconds', 'Telegram send latency by outcome', ('event',))
+
+# Optional sampling profiler: PROFILE_SAMPLE_RATE of requests are profiled, and those slower than
+# PROFILE_SLOW_MS are printed with their top functions
+profiler = SlowRequestProfiler(
+    sample_rate=float(os.environ.get('PROFILE_SAMPLE_RATE', 0)),
+    threshold_seconds=float(os.environ.get('PROFILE_SLOW_MS', 1000)) / 1000,
+)
+
+def observe_storage(backend, operation, seconds):
+    STORAGE_CALLS.inc(backend=backend, operation=operation)
+    STORAGE_LATENCY.observe(seconds, backend=backend, operation=operation)
+    if has_request_context():
+        g.storage_calls = g.get('storage_calls', 0) + 1
+
+storage.observer = observe_storage
+
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+    g.storage_calls = 0
+    g.profile = profiler.start()
+
+@app.after_request
+def record_request_metrics(response):
+    started = g.pop('request_started', None)
+    if started is None:
+        return response
+    elapsed = time.perf_counter() - started
+    route = request.url_rule.rule if request.url_rule else 'unmatched'
+    REQUEST_LATENCY.observe(elapsed, route=route, method=request.method, status=str(response.status_code))
+    STORAGE_CALLS_PER_REQUEST.observe(g.get('storage_calls', 0), route=route)
+    profile = g.pop('profile', None)
+    if profile is not None:
+        profiler.stop(profile, f"{request.method} {request.path}", elapsed)
+    return response
 
 # Menu data updated with PDF catalog (March 2025) and new Combos category
 menu = {
@@ -147,22 +222,48 @@ menu = {
     ]
 }
 
-# Global variables
-used_order_numbers = set()
-next_order_number = 1
-remembered_customer = {}
-
-# Generate unique order number
-def generate_order_number():
-    global next_order_number
-    order_number = f"#{next_order_number:04d}"
-    next_order_number += 1
-    return order_number
-
-# Send Telegram notification
+# Product catalog: O(1) lookups by ID or name, built once at import
+catalog = Catalog(menu)
+search_index = SearchIndex(catalog)
+
+# Idempotency key for a checkout: the one rendered into the checkout form, or, for clients that
+# don't send one, a key derived from the cart's identity and last change (None without a cart)
+IDEMPOTENCY_KEY_PATTERN = re.compile(r'^[A-Za-z0-9_-]{16,128}$')
+
+def checkout_idempotency_key(cart_id):
+    key = request.form.get('idempotency_key', '')
+    if IDEMPOTENCY_KEY_PATTERN.match(key):
+        return key
+    if not cart_id:
+        return None
+    return hashlib.sha256(f"{cart_id}:{storage.get_cart(cart_id)['updated_at']}".encode()).hexdigest()
+
+# Telegram notifications are delivered in the background; TELEGRAM_API_URL can point at a local stub.
+# The outbox only makes alerts durable if NOTIFY_OUTBOX_PATH is on storage that outlives the
+# process (the default lives in the temp directory). On serverless platforms such as Vercel the
+# instance is frozen after each response and its /tmp discarded with it, so there (NOTIFY_SYNC=1,
+# the default when VERCEL is set) each request waits for its notifications to be delivered,
+# up to NOTIFY_FLUSH_TIMEOUT seconds, before it returns.
+TELEGRAM_BOT_TOKEN = os.environ.get('TELEGRAM_BOT_TOKEN', "7587815614:AAFnVVfaWqNjtmHWuIB88azzEU-vx0lKQak")
+TELEGRAM_CHAT_ID = os.environ.get('TELEGRAM_CHAT_ID', "-4891155078")
+notifier = NotificationDispatcher(
+    TelegramTransport(TELEGRAM_BOT_TOKEN, api_url=os.environ.get('TELEGRAM_API_URL', 'https://api.telegram.org')),
+    outbox_path=os.environ.get('NOTIFY_OUTBOX_PATH'),
+    workers=int(os.environ.get('NOTIFY_WORKERS', 2)),
+)
+
+def observe_notification(event, seconds):
+    NOTIFICATIONS.inc(event=event)
+    if seconds is not None:
+        NOTIFICATION_LATENCY.observe(seconds, event=event)
+
+notifier.observer = observe_notification
+NOTIFY_SYNC = os.environ.get('NOTIFY_SYNC', '1' if os.environ.get('VERCEL') else '0') == '1'
+NOTIFY_FLUSH_TIMEOUT = float(os.environ.get('NOTIFY_FLUSH_TIMEOUT', 8))
+
+# Send Telegram notification (queued; returns as soon as the message is in the outbox, or once it
+# is delivered when NOTIFY_SYNC is on)
 def send_telegram_notification(order_number, cart_items, customer_details, final_total, payment_method=None, special_note=None):
-    bot_token = "7587815614:AAFnVVfaWqNjtmHWuIB88azzEU-vx0lKQak"
-    chat_id = "-4891155078"
     message = f"Order Number: {order_number}\n\nCustomer Details:\nName: {customer_details['name']}\nSurname: {customer_details.get('surname', 'N/A')}\nPhone: {customer_details['phone']}\nEmail: {customer_details['email']}\n"
     if special_note:
         message += f"Special Note: {special_note}\n"
@@ -173,75 +274,192 @@ def send_telegram_notification(order_number, cart_items, customer_details, final
         else:
             message += f"{item['name']} - R{item['amount']:.2f}\n"
     message += f"\nPayment Method: {payment_method}\nTotal: R{final_total:.2f}\nTime: {time.strftime('%I:%M %p SAST, %B %d, %Y')}"
-    url = f"https://api.telegram.org/bot{bot_token}/sendMessage"
-    params = {"chat_id": chat_id, "text": message}
     try:
-        response = requests.post(url, data=params, timeout=10)
-        if response.status_code == 200 and response.json().get("ok"):
-            print("Notification sent successfully! 🌟")
-        else:
-            print(f"Failed to send notification: {response.text}")
+        message_id = notifier.enqueue(TELEGRAM_CHAT_ID, message)
     except Exception as e:
-        print(f"Failed to send notification: {e}")
+        print(f"Failed to queue notification: {e}")
+        return
+    if NOTIFY_SYNC and not notifier.wait(message_id, NOTIFY_FLUSH_TIMEOUT):
+        print(f"Notification {message_id} not delivered within {NOTIFY_FLUSH_TIMEOUT:g}s; it may be lost with this instance ⚠️")
 
 # Placeholder payment processing
 def process_payment(total, payment_method, order_number):
     print(f"Processing payment of R{total:.2f} via {payment_method} for order {order_number}... 💸")
     return True
 
+# Re-price cart lines against the catalog so checkout never trusts a stale stored price. Carts
+# outlive menu changes, so lines whose product has since been delisted are dropped, not ordered.
+def reprice_cart_items(cart_items):
+    repriced = []
+    for item in cart_items:
+        product = catalog.lookup(product_id=item.get('product_id'), name=item.get('name'))
+        if product is None:
+            continue
+        item['amount'] = product['price']
+        if 'quantity' in item:
+            item['total'] = product['price'] * item['quantity']
+        repriced.append(item)
+    return repriced
+
+# Per-visitor session in Flask's signed cookie: the cart ID and, if the customer asked to be
+# remembered, their checkout details. Nothing is stored server-side and only routes that touch
+# the session read it, so catalog pages get no Set-Cookie or Vary: Cookie and stay cacheable.
+# The cookie expires CART_TTL after the last cart change, the same TTL as the cart itself.
+# SECRET_KEY must be set and shared by all workers: a per-process random key would make each
+# worker (and every restart) reject the others' cookies and silently empty carts. Only a debug
+# server (FLASK_DEBUG=1) falls back to a random key.
+app.secret_key = os.environ.get('SECRET_KEY')
+if not app.secret_key:
+    if os.environ.get('FLASK_DEBUG') != '1':
+        raise RuntimeError("SECRET_KEY is not set; sessions need a key shared by every worker.")
+    app.secret_key = secrets.token_hex(32)
+    print("SECRET_KEY is not set; using a random key for debugging, sessions will not survive a restart ⚠️")
+app.config.update(
+    PERMANENT_SESSION_LIFETIME=datetime.timedelta(seconds=CART_TTL),
+    SESSION_REFRESH_EACH_REQUEST=False,
+    SESSION_COOKIE_HTTPONLY=True,
+    SESSION_COOKIE_SAMESITE='Lax',
+)
+
+CART_ID_PATTERN = re.compile(r'^[A-Za-z0-9_-]{16,64}$')
+
+def get_cart_id(create=False):
+    cart_id = session.get('cart_id')
+    if create:
+        # Every cart write re-issues the cookie, sliding its expiry along with the cart's TTL
+        session.permanent = True
+        session.modified = True
+    if cart_id and CART_ID_PATTERN.match(cart_id):
+        return cart_id
+    if not create:
+        return None
+    cart_id = session['cart_id'] = secrets.token_urlsafe(24)
+    return cart_id
+
+# Load the visitor's cart: one document read, or none at all for a visitor without a cart
+def load_cart():
+    cart_id = get_cart_id()
+    if not cart_id:
+        return []
+    return list_cart_items(storage.get_cart(cart_id))
+
+def cart_total(cart_items):
+    return sum(item['total'] if 'total' in item else item['amount'] for item in cart_items)
+
+# JSON shape of the cart used by /api/cart and the cart mutation responses
+def cart_state(cart_items):
+    return {
+        "items": cart_items,
+        "count": sum(item.get('quantity', 1) for item in cart_items),
+        "total": round(cart_total(cart_items), 2),
+    }
+
 # Add fixed-price item
 def add_fixed_price_item(item, quantity):
-    total = item["price"] * quantity
-    cart_ref = db.collection('carts').document()
-    cart_ref.set({"name": item["name"], "amount": item["price"], "quantity": quantity, "total": total})
-    return f"Added {quantity} x {item['name']} to cart! 🛒"
+    line = storage.add_to_cart(get_cart_id(create=True), item, quantity)
+    return f"Added {quantity} x {item['name']} to cart! 🛒", line
 
 # Remove item from cart
 @app.route('/remove_from_cart', methods=['POST'])
 def remove_from_cart():
     try:
         item_name = request.form.get('name')
-        if not item_name:
+        product_id = request.form.get('product_id')
+        if not item_name and not product_id:
             return jsonify({"error": "Item name is required 🚫", "popup": True}), 400
-        cart_items = [doc for doc in db.collection('carts').where('name', '==', item_name).get()]
-        if not cart_items:
+        # Lines are removed by the posted product ID, not through the catalog, so a product
+        # delisted since it was added can still be taken out; name-only clients need the catalog
+        product = catalog.lookup(product_id=product_id, name=item_name)
+        product_id = product_id or (product['id'] if product else None)
+        cart_id = get_cart_id()
+        cart = storage.remove_from_cart(cart_id, product_id) if product_id and cart_id else None
+        if not cart:
             return jsonify({"error": "Item not found in cart 😞", "popup": True}), 404
-        for doc in cart_items:
-            doc.reference.delete()
-        return jsonify({"message": f"Removed {item_name} from cart! 🗑️", "popup": True, "refresh": True}), 200
+        item_name = product['name'] if product else item_name or product_id
+        return jsonify({"message": f"Removed {item_name} from cart! 🗑️", "popup": True, "cart": cart_state(list_cart_items(cart))}), 200
     except Exception as e:
         return jsonify({"error": f"Failed to remove item: {str(e)} 🚫", "popup": True}), 500
 
+# Rendered-page cache for the catalog routes. Pages are keyed by the catalog version, so a menu
+# change invalidates them, and served with a strong ETag so browsers and the Vercel edge revalidate
+# with a 304 instead of re-downloading the page.
+PAGE_CACHE_CONTROL = "public, max-age=300, s-maxage=3600, stale-while-revalidate=86400"
+page_cache = {}
+
+# Absolute links in cached pages (WhatsApp shares) are built from the configured public URL,
+# never from the request's Host header, so one cached copy serves every host. Defaults to the
+# Vercel production domain when deployed there; anywhere else it must be set, or every share link
+# would point at localhost, except on a debug server (FLASK_DEBUG=1).
+PUBLIC_BASE_URL = os.environ.get('PUBLIC_BASE_URL')
+if not PUBLIC_BASE_URL and os.environ.get('VERCEL_PROJECT_PRODUCTION_URL'):
+    PUBLIC_BASE_URL = f"https://{os.environ['VERCEL_PROJECT_PRODUCTION_URL']}"
+if not PUBLIC_BASE_URL:
+    if os.environ.get('FLASK_DEBUG') != '1':
+        raise RuntimeError("PUBLIC_BASE_URL is not set; share links need the site's public address.")
+    PUBLIC_BASE_URL = 'http://localhost:5000'
+PUBLIC_BASE_URL = PUBLIC_BASE_URL.rstrip('/')
+
+def public_url(endpoint, **values):
+    return PUBLIC_BASE_URL + url_for(endpoint, **values)
+
+app.jinja_env.globals['public_url'] = public_url
+
+def cached_page(view):
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        key = (request.endpoint, catalog.version)
+        entry = page_cache.get(key)
+        if entry is None:
+            response = make_response(view(*args, **kwargs))
+            if response.status_code != 200:
+                return response
+            body = response.get_data()
+            entry = page_cache[key] = (body, response.content_type, hashlib.sha256(body).hexdigest()[:32])
+        body, content_type, etag = entry
+        response = make_response(body)
+        response.content_type = content_type
+        response.set_etag(etag)
+        response.headers['Cache-Control'] = PAGE_CACHE_CONTROL
+        return response.make_conditional(request)
+    return wrapper
+
 # Routes
 @app.route('/')
 def home():
     return render_template('home.html')
 
 @app.route('/menus')
+@cached_page
 def menus():
     return render_template('menus.html', menu=menu)
 
 @app.route('/health_wellness')
+@cached_page
 def health_wellness():
     return render_template('health_wellness.html', menu=menu["Health & Wellness"])
 
 @app.route('/skincare_personal_care')
+@cached_page
 def skincare_personal_care():
     return render_template('skincare_personal_care.html', menu=menu["Skincare & Personal Care"])
 
 @app.route('/weight_management')
+@cached_page
 def weight_management():
     return render_template('weight_management.html', menu=menu["Weight Management"])
 
 @app.route('/kids_family')
+@cached_page
 def kids_family():
     return render_template('kids_family.html', menu=menu["Kids & Family"])
 
 @app.route('/combos')
+@cached_page
 def combos():
     return render_template('combos.html', menu=menu["Combos"])
 
 @app.route('/join_options')
+@cached_page
 def join_options():
     return render_template('business_packages.html', menu=menu["Join Options"])
 
@@ -251,23 +469,7 @@ def add_to_cart():
     item_name = data.get('name')
     quantity = int(data.get('quantity', 1))
 
-    item = None
-    for category in menu.values():
-        if isinstance(category, list):  # For Join Options
-            for i in category:
-                if i['name'] == item_name:
-                    item = i
-                    break
-        else:
-            for subcat, items in category.items():
-                for i in items:
-                    if i['name'] == item_name:
-                        item = i
-                        break
-                if item:
-                    break
-        if item:
-            break
+    item = catalog.lookup(product_id=data.get('product_id'), name=item_name)
 
     if not item:
         return jsonify({"error": "Item not found in menu 🚫", "popup": True}), 404
@@ -276,18 +478,58 @@ def add_to_cart():
         if quantity <= 0:
             return jsonify({"error": "Quantity must be positive 🚫", "popup": True}), 400
 
-        message = add_fixed_price_item(item, quantity)
-        return jsonify({"message": message, "popup": True, "refresh": True}), 200
+        message, line = add_fixed_price_item(item, quantity)
+        # The client bumps its cart badge by the added quantity, so no cart read is needed here
+        return jsonify({"message": message, "popup": True, "added": {"product_id": line["product_id"], "name": line["name"], "quantity": quantity}}), 200
     except ValueError as ve:
         return jsonify({"error": f"Invalid input: {str(ve)} 🚫", "popup": True}), 400
     except Exception as e:
         return jsonify({"error": f"Server error: {str(e)} 🚫", "popup": True}), 500
 
+# Product search for type-ahead, served from the in-memory index without touching storage:
+#   /search?q=aloe&min_price=100&max_price=500&category=Combos&limit=10
+SEARCH_MAX_LIMIT = 50
+SEARCH_CACHE_CONTROL = 'public, max-age=300'
+
+def price_arg(name):
+    value = request.args.get(name, '').strip()
+    if not value:
+        return None
+    price = float(value)
+    if not math.isfinite(price):
+        raise ValueError(f"Invalid {name}: {value}")
+    return price
+
+@app.route('/search')
+def search():
+    try:
+        query = request.args.get('q', '')[:100]
+        min_price = price_arg('min_price')
+        max_price = price_arg('max_price')
+        limit = min(max(int(request.args.get('limit', 20)), 1), SEARCH_MAX_LIMIT)
+    except ValueError:
+        return jsonify({"error": "Invalid search parameters 🚫"}), 400
+    results = search_index.search(query, min_price, max_price, request.args.getlist('category'), limit)
+    response = jsonify(dict(results, query=query))
+    response.headers['Cache-Control'] = SEARCH_CACHE_CONTROL
+    response.add_etag()
+    return response.make_conditional(request)
+
+# Cart state for the client-side cart badge and cart page
+@app.route('/api/cart')
+def api_cart():
+    try:
+        response = jsonify(cart_state(load_cart()))
+        response.headers['Cache-Control'] = 'no-store'
+        return response
+    except Exception as e:
+        return jsonify({"error": f"Failed to load cart: {str(e)} 🚫"}), 500
+
 @app.route('/view_cart')
 def view_cart():
     try:
-        cart_items = [doc.to_dict() for doc in db.collection('carts').get()]
-        total = sum(item['total'] if 'total' in item else item['amount'] for item in cart_items)
+        cart_items = load_cart()
+        total = cart_total(cart_items)
         return render_template('cart.html', cart_items=cart_items, total=total)
     except Exception as e:
         return redirect(url_for('menus'))  # Fallback to menus if error occurs
@@ -295,12 +537,16 @@ def view_cart():
 @app.route('/clear_cart')
 def clear_cart():
     try:
-        for doc in db.collection('carts').get():
-            doc.reference.delete()
-        return jsonify({"message": "Cart cleared! 🗑️", "popup": True, "redirect": url_for('view_cart')}), 200
+        cart_id = get_cart_id()
+        if cart_id:
+            storage.clear_cart(cart_id)
+        return jsonify({"message": "Cart cleared! 🗑️", "popup": True, "cart": cart_state([]), "redirect": url_for('view_cart')}), 200
     except Exception as e:
         return jsonify({"error": f"Failed to clear cart: {str(e)} 🚫", "popup": True}), 500
 
+def order_placed_response(order):
+    return jsonify({"message": f"Collection order {order['order_number']} placed! Total: R{order['total']:.2f} 🎉", "cart_items": order["items"], "total": order["total"], "popup": True, "redirect": url_for('view_cart')}), 200
+
 @app.route('/checkout', methods=['GET', 'POST'])
 def checkout():
     if request.method == 'POST':
@@ -323,33 +569,94 @@ def checkout():
                 return jsonify({"error": f"{payment_method} payment is coming soon and not available yet 🚧", "popup": True}), 400
 
             if remember:
-                remembered_customer.update({"name": name, "surname": surname, "phone": phone, "email": email, "remembered": True})
+                session.permanent = True
+                session['customer'] = {"name": name, "surname": surname, "phone": phone, "email": email, "remembered": True}
+            else:
+                session.pop('customer', None)
 
             customer_details = {"name": name, "surname": surname, "phone": phone, "email": email}
-            cart_items = [doc.to_dict() for doc in db.collection('carts').get()]
-            final_total = sum(item['total'] if 'total' in item else item['amount'] for item in cart_items)
-
-            if not cart_items:
+            timestamp = time.time()
+
+            # Runs inside the checkout transaction on the cart as it is committed
+            def build_order(cart):
+                cart_items = reprice_cart_items(list_cart_items(cart))
+                if not cart_items:
+                    return None
+                return {"customer": customer_details, "items": cart_items, "total": cart_total(cart_items), "payment_method": payment_method, "special_note": special_note, "timestamp": timestamp}
+
+            cart_id = get_cart_id()
+            idempotency_key = checkout_idempotency_key(cart_id)
+            if cart_id and idempotency_key:
+                # Reads the cart, records the order and deletes the cart in one transaction; a
+                # resubmitted form gets the order its first submit placed
+                order, created = storage.place_cart_order(idempotency_key, cart_id, build_order)
+            else:
+                order, created = (storage.get_order(idempotency_key) if idempotency_key else None), False
+            if order is None:
                 return jsonify({"error": "Cart is empty 😞", "popup": True}), 400
 
-            order_number = generate_order_number()
-            send_telegram_notification(order_number, cart_items, customer_details, final_total, payment_method=payment_method, special_note=special_note)
-            process_payment(final_total, payment_method, order_number)
-            for doc in db.collection('carts').get():
-                doc.reference.delete()
-            return jsonify({"message": f"Collection order {order_number} placed! Total: R{final_total:.2f} 🎉", "cart_items": cart_items, "total": final_total, "popup": True, "redirect": url_for('view_cart')}), 200
+            if created:
+                order_number = order["order_number"]
+                send_telegram_notification(order_number, order["items"], customer_details, order["total"], payment_method=payment_method, special_note=special_note)
+                process_payment(order["total"], payment_method, order_number)
+            return order_placed_response(order)
         except ValueError as ve:
             return jsonify({"error": f"Invalid input: {str(ve)} 🚫", "popup": True}), 400
         except Exception as e:
             return jsonify({"error": f"Checkout failed: {str(e)} 🚫", "popup": True}), 500
 
     try:
-        cart_items = [doc.to_dict() for doc in db.collection('carts').get()]
-        total = sum(item['total'] if 'total' in item else item['amount'] for item in cart_items)
-        return render_template('checkout.html', cart_items=cart_items, total=total, remembered_customer=remembered_customer)
+        cart_items = load_cart()
+        total = cart_total(cart_items)
+        return render_template('checkout.html', cart_items=cart_items, total=total, remembered_customer=session.get('customer', {}), idempotency_key=secrets.token_urlsafe(24))
     except Exception as e:
         return jsonify({"error": f"Failed to load checkout: {str(e)} 🚫", "popup": True}), 500
 
+# Spam protection for the join and contact forms: token buckets per visitor IP and per phone
+# number and email address (limits as "COUNT/SECONDS"), and identical submissions within
+# FORM_DEDUP_SECONDS answered without another write or Telegram message. RATE_LIMIT_DB
+# points the limiter at an SQLite file shared by all workers; by default it is per process.
+FORM_RATE_LIMITS = {
+    'ip': Rule.parse(os.environ.get('FORM_RATE_LIMIT_IP', '10/600')),
+    'phone': Rule.parse(os.environ.get('FORM_RATE_LIMIT_CONTACT', '3/3600')),
+    'email': Rule.parse(os.environ.get('FORM_RATE_LIMIT_CONTACT', '3/3600')),
+}
+RATE_LIMIT_DB = os.environ.get('RATE_LIMIT_DB')
+form_limiter = RateLimiter(
+    FORM_RATE_LIMITS,
+    SqliteStore(RATE_LIMIT_DB) if RATE_LIMIT_DB else MemoryStore(),
+    dedup_window=int(os.environ.get('FORM_DEDUP_SECONDS', 300)),
+)
+FORM_SUBMISSIONS = metrics.counter('form_submissions', 'Join and contact form submissions by outcome', ('form', 'outcome'))
+JOIN_ACCEPTED = "Join request submitted! Zama will contact you soon. 🎉"
+CONTACT_ACCEPTED = "Message sent successfully! 🎉"
+
+# Returns a response for a duplicate or rate-limited submission, or None to process it.
+# A duplicate gets the original success message; the limiter is only charged for new content.
+def screen_form_submission(form, accepted_message, phone, email, *content):
+    phone = re.sub(r'\D', '', phone)
+    email = email.lower()
+    g.submission_key = form_limiter.claim(form, phone, email, *content)
+    if g.submission_key is None:
+        FORM_SUBMISSIONS.inc(form=form, outcome='duplicate')
+        return jsonify({"message": accepted_message, "popup": True}), 200
+    retry_after = form_limiter.hit(ip=request.remote_addr, phone=phone, email=email)
+    if retry_after:
+        release_form_submission()
+        FORM_SUBMISSIONS.inc(form=form, outcome='limited')
+        minutes = math.ceil(retry_after / 60)
+        response = jsonify({"error": f"Too many submissions, please try again in {minutes} minute{'s' if minutes != 1 else ''} ⏳", "popup": True})
+        response.headers['Retry-After'] = str(math.ceil(retry_after))
+        return response, 429
+    FORM_SUBMISSIONS.inc(form=form, outcome='accepted')
+    return None
+
+# A submission that failed to process may be retried as-is
+def release_form_submission():
+    key = g.pop('submission_key', None)
+    if key:
+        form_limiter.release(key)
+
 @app.route('/join', methods=['GET', 'POST'])
 def join():
     if request.method == 'POST':
@@ -360,12 +667,16 @@ def join():
             package = request.form.get('package')
             if not name or not phone or not email or not package:
                 return jsonify({"error": "All fields are required 🚫", "popup": True}), 400
+            rejection = screen_form_submission('join', JOIN_ACCEPTED, phone, email, name, package)
+            if rejection:
+                return rejection
 
-            db.collection('join_requests').document().set({"name": name, "phone": phone, "email": email, "package": package, "timestamp": time.time()})
+            storage.add_join_request({"name": name, "phone": phone, "email": email, "package": package, "timestamp": time.time()})
             message = f"New Join Request\nName: {name}\nPhone: {phone}\nEmail: {email}\nPackage: {package}\nTime: {time.strftime('%I:%M %p SAST, %B %d, %Y')}\nContact Zama Sibiya to finalize! 📝"
             send_telegram_notification(order_number=None, cart_items=[], customer_details={"name": name, "phone": phone, "email": email}, final_total=0, payment_method=None, special_note=message)
-            return jsonify({"message": "Join request submitted! Zama will contact you soon. 🎉", "popup": True}), 200
+            return jsonify({"message": JOIN_ACCEPTED, "popup": True}), 200
         except Exception as e:
+            release_form_submission()
             return jsonify({"error": f"Join request failed: {str(e)} 🚫", "popup": True}), 500
     return render_template('join.html', menu=menu["Join Options"])
 
@@ -379,14 +690,43 @@ def contact():
             message = request.form['message'].strip()
             if not name or not phone or not email or not message:
                 return jsonify({"error": "All fields are required 🚫", "popup": True}), 400
-            db.collection('contacts').document().set({"name": name, "phone": phone, "email": email, "message": message, "timestamp": time.time()})
+            rejection = screen_form_submission('contact', CONTACT_ACCEPTED, phone, email, name, message)
+            if rejection:
+                return rejection
+            storage.add_contact({"name": name, "phone": phone, "email": email, "message": message, "timestamp": time.time()})
             message_text = f"New Contact Message\nName: {name}\nPhone: {phone}\nEmail: {email}\nMessage: {message}\nTime: {time.strftime('%I:%M %p SAST, %B %d, %Y')} 📬"
             send_telegram_notification(order_number=None, cart_items=[], customer_details={"name": name, "phone": phone, "email": email}, final_total=0, payment_method=None, special_note=message_text)
-            return jsonify({"message": "Message sent successfully! 🎉", "popup": True}), 200
+            return jsonify({"message": CONTACT_ACCEPTED, "popup": True}), 200
         except Exception as e:
+            release_form_submission()
             return jsonify({"error": f"Contact submission failed: {str(e)} 🚫", "popup": True}), 500
     return render_template('contact.html')
 
+# Bearer-token check for internal endpoints. Without a configured token they are closed, except on
+# a debug server (FLASK_DEBUG=1)
+def bearer_authorized(token):
+    if not token:
+        return os.environ.get('FLASK_DEBUG') == '1'
+    return hmac.compare_digest(request.headers.get('Authorization', '').encode(), f"Bearer {token}".encode())
+
+# Prometheus scrape endpoint; requires METRICS_TOKEN as a bearer token
+@app.route('/metrics')
+def metrics_endpoint():
+    if not bearer_authorized(os.environ.get('METRICS_TOKEN')):
+        return jsonify({"error": "Unauthorized 🚫"}), 401
+    return metrics.render(), 200, {'Content-Type': Registry.CONTENT_TYPE, 'Cache-Control': 'no-store'}
+
+# Scheduled sweep of expired carts (Vercel Cron, see vercel.json, sends CRON_SECRET as a bearer token)
+@app.route('/tasks/expire_carts')
+def expire_carts():
+    if not bearer_authorized(os.environ.get('CRON_SECRET')):
+        return jsonify({"error": "Unauthorized 🚫"}), 401
+    try:
+        removed = storage.expire_carts()
+        return jsonify({"message": f"Expired {removed} carts 🗑️", "removed": removed}), 200
+    except Exception as e:
+        return jsonify({"error": f"Cart sweep failed: {str(e)} 🚫"}), 500
+
 @app.errorhandler(404)
 def page_not_found(e):
     return render_template('404.html'), 404
@@ -0,0 +1,54 @@
+import json
+import os
+import threading
+
+from markupsafe import Markup, escape
+
+# Written by scripts/build_images.py; maps a source image (relative to static/images) to its
+# resized, content-hashed variants. The build output is committed so every deploy ships it; an
+# image the manifest doesn't know yet (added without a rebuild) is served unchanged.
+MANIFEST_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static', 'images', 'build', 'manifest.json')
+BUILD_URL_PREFIX = '/static/images/build/'
+
+# Preferred formats first; the last format is the <img> fallback
+SOURCE_TYPES = (('avif', 'image/avif'), ('webp', 'image/webp'))
+
+_manifest = None
+_manifest_lock = threading.Lock()
+
+
+def load_manifest(path=MANIFEST_PATH):
+    global _manifest
+    if _manifest is None:
+        with _manifest_lock:
+            if _manifest is None:
+                try:
+                    with open(path, encoding='utf-8') as f:
+                        _manifest = json.load(f)
+                except (OSError, ValueError):
+                    _manifest = {}
+    return _manifest
+
+
+def _srcset(variants):
+    return ', '.join(f"{BUILD_URL_PREFIX}{variant['file']} {variant['width']}w" for variant in variants)
+
+
+# Jinja helper: <picture> with AVIF/WebP sources and a JPEG/PNG fallback, lazily loaded
+def responsive_image(src, alt, sizes='100vw', class_='', loading='lazy'):
+    entry = load_manifest().get(src)
+    attrs = f'alt="{escape(alt)}" loading="{loading}" decoding="async"'
+    if class_:
+        attrs += f' class="{escape(class_)}"'
+    if not entry:
+        return Markup(f'<img src="/static/images/{escape(src)}" {attrs}>')
+    variants = entry['variants']
+    fallback = variants['fallback']
+    sources = ''.join(
+        f'<source type="{mime}" srcset="{_srcset(variants[fmt])}" sizes="{escape(sizes)}">'
+        for fmt, mime in SOURCE_TYPES if variants.get(fmt)
+    )
+    return Markup(
+        f'<picture>{sources}<img src="{BUILD_URL_PREFIX}{fallback[0]["file"]}" srcset="{_srcset(fallback)}" '
+        f'sizes="{escape(sizes)}" width="{entry["width"]}" height="{entry["height"]}" {attrs}></picture>'
+    )
@@ -0,0 +1,156 @@
+import bisect
+import functools
+import hashlib
+import json
+import re
+import unicodedata
+
+TOKEN_PATTERN = re.compile(r'[a-z0-9]+')
+
+
+# Stable product ID from a display name, matching static/images/products/<id>.jpg
+def product_slug(name):
+    slug = unicodedata.normalize('NFKD', name).encode('ascii', 'ignore').decode('ascii')
+    slug = slug.lower().replace("'", '').replace(':', '_')
+    return re.sub(r'\s+', '_', slug.strip())
+
+
+# Lowercase ASCII word tokens; "Men's Aloe-Gel" -> ['mens', 'aloe', 'gel']
+def tokenize(text):
+    text = unicodedata.normalize('NFKD', text).encode('ascii', 'ignore').decode('ascii')
+    return TOKEN_PATTERN.findall(text.lower().replace("'", ''))
+
+
+class Catalog:
+    # Indexes built once from the nested menu dict:
+    #   by_id       product ID -> product
+    #   by_name     display name -> product
+    #   categories  category -> list of products in menu order
+    #   version     content hash of the menu, used to key rendered-page caches
+    def __init__(self, menu):
+        self.by_id = {}
+        self.by_name = {}
+        self.categories = {}
+        for category, sections in menu.items():
+            # Join Options is a flat list, every other category is {subcategory: [items]}
+            if isinstance(sections, list):
+                sections = {None: sections}
+            products = []
+            for subcategory, items in sections.items():
+                for item in items:
+                    product = self._register(item, category, subcategory)
+                    products.append(product)
+            self.categories[category] = products
+        self.version = hashlib.sha256(json.dumps(menu, sort_keys=True).encode()).hexdigest()[:16]
+
+    def _register(self, item, category, subcategory):
+        product_id = product_slug(item['name'])
+        existing = self.by_id.get(product_id)
+        if existing is not None:
+            # The same product may be listed under several categories (e.g. Forever Lite),
+            # but two different products must never resolve to one ID or name.
+            if existing['name'] != item['name'] or existing['price'] != item['price']:
+                raise ValueError(
+                    f"Duplicate catalog entry '{item['name']}' in {category} conflicts with "
+                    f"'{existing['name']}' (R{existing['price']:.2f}) in {existing['category']}"
+                )
+            existing['categories'].append(category)
+            item['id'] = product_id
+            item['price_display'] = existing['price_display']
+            return existing
+        # Prices are formatted once here rather than through floatformat on every render
+        item['price_display'] = f"{item['price']:.2f}"
+        product = dict(item, id=product_id, category=category, subcategory=subcategory, categories=[category])
+        # Templates render straight from the menu dict, so expose the ID there too
+        item['id'] = product_id
+        self.by_id[product_id] = product
+        self.by_name[item['name']] = product
+        return product
+
+    def lookup(self, product_id=None, name=None):
+        if product_id:
+            return self.by_id.get(product_id)
+        if name:
+            return self.by_name.get(name)
+        return None
+
+    def __len__(self):
+        return len(self.by_id)
+
+
+# Inverted index over product names and descriptions, built once from the catalog for /search.
+# Every query term matches as a prefix (so "alo ver" finds Aloe Vera Gel while typing) and all
+# terms must match. Name hits outrank description hits; ties keep menu order. Results are
+# memoized per normalized query, which is safe because the index never changes after startup.
+class SearchIndex:
+    NAME_WEIGHT = 3
+    DESCRIPTION_WEIGHT = 1
+
+    def __init__(self, catalog, cache_size=1024):
+        self.categories = list(catalog.categories)
+        self.products = list(catalog.by_id.values())
+        self.documents = [
+            {key: product[key] for key in ('id', 'name', 'price', 'price_display', 'description', 'categories')}
+            for product in self.products
+        ]
+        # token -> {product position: field weight}
+        self.postings = {}
+        for position, product in enumerate(self.products):
+            for field, weight in (('name', self.NAME_WEIGHT), ('description', self.DESCRIPTION_WEIGHT)):
+                for token in tokenize(product.get(field, '')):
+                    postings = self.postings.setdefault(token, {})
+                    postings[position] = max(postings.get(position, 0), weight)
+        self.vocabulary = sorted(self.postings)
+        self._cached_search = functools.lru_cache(maxsize=cache_size)(self._search)
+
+    def _match(self, term):
+        # Tokens sharing the prefix sit next to each other in the sorted vocabulary
+        scores = {}
+        index = bisect.bisect_left(self.vocabulary, term)
+        while index < len(self.vocabulary) and self.vocabulary[index].startswith(term):
+            token = self.vocabulary[index]
+            for position, weight in self.postings[token].items():
+                # An exact word beats a prefix of a longer one
+                score = weight + 1 if token == term else weight
+                scores[position] = max(scores.get(position, 0), score)
+            index += 1
+        return scores
+
+    def search(self, query='', min_price=None, max_price=None, categories=(), limit=20):
+        terms = tuple(dict.fromkeys(tokenize(query)))
+        return self._cached_search(terms, min_price, max_price, tuple(sorted(set(categories))), limit)
+
+    def _search(self, terms, min_price, max_price, categories, limit):
+        scores = None
+        for term in terms:
+            matches = self._match(term)
+            if scores is None:
+                scores = matches
+            else:
+                scores = {position: scores[position] + score for position, score in matches.items() if position in scores}
+            if not scores:
+                break
+        if scores is None:
+            scores = dict.fromkeys(range(len(self.products)), 0)
+
+        hits = []
+        for position, score in scores.items():
+            price = self.products[position]['price']
+            if (min_price is None or price >= min_price) and (max_price is None or price <= max_price):
+                hits.append((position, score))
+
+        # Facet counts cover every price-matched hit, so picking one category still shows the others
+        counts = dict.fromkeys(self.categories, 0)
+        for position, _ in hits:
+            for category in self.products[position]['categories']:
+                counts[category] += 1
+        if categories:
+            wanted = set(categories)
+            hits = [(position, score) for position, score in hits if wanted.intersection(self.products[position]['categories'])]
+
+        hits.sort(key=lambda hit: (-hit[1], hit[0]))
+        return {
+            "total": len(hits),
+            "results": [self.documents[position] for position, _ in hits[:limit]],
+            "facets": {"categories": {category: count for category, count in counts.items() if count}},
+        }
@@ -0,0 +1,341 @@
+import atexit
+import heapq
+import itertools
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+
+class RetryableError(Exception):
+    def __init__(self, message, retry_after=None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class PermanentError(Exception):
+    pass
+
+
+# Telegram Bot API transport over one pooled keep-alive session.
+# api_url can point at a local stub server for tests and benchmarks.
+class TelegramTransport:
+    def __init__(self, bot_token, api_url='https://api.telegram.org', pool_size=4, timeout=10):
+        self.url = f"{api_url.rstrip('/')}/bot{bot_token}/sendMessage"
+        self.timeout = timeout
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+
+    def send(self, chat_id, text):
+        try:
+            response = self.session.post(self.url, data={"chat_id": chat_id, "text": text}, timeout=self.timeout)
+        except requests.RequestException as e:
+            raise RetryableError(str(e))
+        try:
+            body = response.json()
+        except ValueError:
+            body = {}
+        if response.status_code == 200 and body.get("ok"):
+            return
+        if response.status_code == 429 or response.status_code >= 500:
+            retry_after = (body.get("parameters") or {}).get("retry_after")
+            raise RetryableError(response.text, retry_after=retry_after)
+        raise PermanentError(response.text)
+
+
+# Paces sends per chat: Telegram allows about 1 message/second in a private chat
+# and 20 messages/minute in a group (negative chat IDs), ~30/second overall.
+class ChatRateLimiter:
+    def __init__(self, private_interval=1.0, group_interval=3.0, global_interval=1 / 30):
+        self.private_interval = private_interval
+        self.group_interval = group_interval
+        self.global_interval = global_interval
+        self._next_slot = {}
+        self._next_global = 0.0
+        self._lock = threading.Lock()
+
+    def reserve(self, chat_id):
+        interval = self.group_interval if str(chat_id).startswith('-') else self.private_interval
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next_slot.get(chat_id, 0.0), self._next_global)
+            self._next_slot[chat_id] = slot + interval
+            self._next_global = slot + self.global_interval
+        return slot - now
+
+    def wait(self, chat_id):
+        delay = self.reserve(chat_id)
+        if delay > 0:
+            time.sleep(delay)
+
+
+# Durable outbox: every message is written to SQLite before it is queued and only
+# removed once delivered, so alerts survive a crash or restart. Rows are leased
+# to one process at a time so several gunicorn workers can share the file.
+class Outbox:
+    def __init__(self, path, lease_seconds=300):
+        self.lease_seconds = lease_seconds
+        self.owner = f"{os.getpid()}-{id(self)}"
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False, isolation_level=None)
+        if path != ':memory:':
+            self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS outbox ("
+            "id INTEGER PRIMARY KEY AUTOINCREMENT, chat_id TEXT NOT NULL, text TEXT NOT NULL, "
+            "attempts INTEGER NOT NULL DEFAULT 0, status TEXT NOT NULL DEFAULT 'pending', "
+            "claimed_by TEXT, claimed_at REAL, created_at REAL NOT NULL, last_error TEXT)"
+        )
+
+    def add(self, chat_id, text):
+        now = time.time()
+        with self._lock:
+            cursor = self._conn.execute(
+                "INSERT INTO outbox (chat_id, text, claimed_by, claimed_at, created_at) VALUES (?, ?, ?, ?, ?)",
+                (str(chat_id), text, self.owner, now, now),
+            )
+        return cursor.lastrowid
+
+    def get(self, message_id):
+        with self._lock:
+            return self._conn.execute(
+                "SELECT id, chat_id, text, attempts FROM outbox WHERE id = ? AND status = 'pending'", (message_id,)
+            ).fetchone()
+
+    def claim_stale(self):
+        # Take over pending rows that were released or whose lease expired, i.e. left behind by
+        # a dead process. Returns only the rows newly claimed, so none is scheduled twice.
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                rows = self._conn.execute(
+                    "SELECT id, attempts FROM outbox WHERE status = 'pending' AND claimed_by IS NOT ? "
+                    "AND (claimed_by IS NULL OR claimed_at < ?)",
+                    (self.owner, now - self.lease_seconds),
+                ).fetchall()
+                self._conn.executemany(
+                    "UPDATE outbox SET claimed_by = ?, claimed_at = ? WHERE id = ?",
+                    [(self.owner, now, message_id) for message_id, _ in rows],
+                )
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._conn.execute("COMMIT")
+        return rows
+
+    # Heartbeat: extend the lease on every row this process still holds
+    def renew(self):
+        with self._lock:
+            self._conn.execute(
+                "UPDATE outbox SET claimed_at = ? WHERE status = 'pending' AND claimed_by = ?", (time.time(), self.owner)
+            )
+
+    def delivered(self, message_id):
+        with self._lock:
+            self._conn.execute("DELETE FROM outbox WHERE id = ?", (message_id,))
+
+    def failed(self, message_id, error, dead=False):
+        with self._lock:
+            self._conn.execute(
+                "UPDATE outbox SET attempts = attempts + 1, last_error = ?, claimed_at = ?, status = ? WHERE id = ?",
+                (error, time.time(), 'dead' if dead else 'pending', message_id),
+            )
+
+    def release(self):
+        with self._lock:
+            self._conn.execute(
+                "UPDATE outbox SET claimed_by = NULL WHERE status = 'pending' AND claimed_by = ?", (self.owner,)
+            )
+
+
+# Background dispatcher: enqueue() persists the message and returns immediately,
+# a small worker pool delivers it with per-chat pacing and exponential backoff.
+# observer, if set, is called as observer(event, seconds) for queued/sent/retry/failed events;
+# seconds is the transport call duration (None for queued).
+class NotificationDispatcher:
+    def __init__(self, transport, outbox_path=None, workers=2, max_attempts=8, base_delay=1.0, max_delay=60.0,
+                 rate_limiter=None, lease_seconds=300):
+        self.transport = transport
+        self.outbox_path = outbox_path or os.path.join(tempfile.gettempdir(), 'forever-zama-outbox.sqlite3')
+        self.lease_seconds = lease_seconds
+        self.workers = workers
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.rate_limiter = rate_limiter or ChatRateLimiter()
+        self.observer = None
+        self.outbox = None
+        self._heap = []
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self._threads = []
+        self._unsettled = set()
+        self._closed = False
+        self._start_lock = threading.Lock()
+        self._pid = None
+
+    # Workers start on first use, after any gunicorn fork, and replay the outbox. A housekeeping
+    # thread keeps this process's leases fresh and keeps reclaiming rows from processes that died
+    # later on (a respawned gunicorn worker starts well inside its predecessor's lease).
+    def start(self):
+        if self._pid == os.getpid():
+            return
+        with self._start_lock:
+            if self._pid == os.getpid():
+                return
+            self.outbox = Outbox(self.outbox_path, lease_seconds=self.lease_seconds)
+            self._cond = threading.Condition()
+            self._heap = []
+            self._threads = []
+            self._unsettled = set()
+            self._closed = False
+            for message_id, attempts in self.outbox.claim_stale():
+                self._schedule(message_id, 0)
+            for i in range(self.workers):
+                thread = threading.Thread(target=self._run, name=f"notify-worker-{i}", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+            thread = threading.Thread(target=self._housekeep, name="notify-housekeeping", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+            self._pid = os.getpid()
+            atexit.register(self.close)
+
+    def enqueue(self, chat_id, text):
+        self.start()
+        message_id = self.outbox.add(chat_id, text)
+        self._schedule(message_id, 0)
+        self._observe('queued')
+        return message_id
+
+    def _observe(self, event, seconds=None):
+        if self.observer is not None:
+            self.observer(event, seconds)
+
+    def _schedule(self, message_id, delay):
+        with self._cond:
+            self._unsettled.add(message_id)
+            heapq.heappush(self._heap, (time.monotonic() + delay, next(self._seq), message_id))
+            self._cond.notify()
+
+    def _next(self):
+        with self._cond:
+            while True:
+                if self._heap:
+                    due, _, message_id = self._heap[0]
+                    wait = due - time.monotonic()
+                    if wait <= 0 or self._closed:
+                        heapq.heappop(self._heap)
+                        return message_id
+                    self._cond.wait(wait)
+                elif self._closed:
+                    return None
+                else:
+                    self._cond.wait()
+
+    def _run(self):
+        while True:
+            message_id = self._next()
+            if message_id is None:
+                return
+            settled = True
+            try:
+                settled = self._deliver(message_id)
+            except Exception as e:
+                # An outbox error (a locked or full database) must not kill the worker; the row is
+                # still pending, so try again later, or leave it for the next start when closing
+                print(f"Notification {message_id} could not be processed: {e}")
+                if not self._closed:
+                    self._schedule(message_id, self.base_delay)
+                    settled = False
+            finally:
+                with self._cond:
+                    if settled:
+                        self._unsettled.discard(message_id)
+                    self._cond.notify_all()
+
+    # Runs three times per lease, so live leases never lapse and stale rows wait at most one
+    # lease plus a third before another process picks them up
+    def _housekeep(self):
+        interval = self.lease_seconds / 3
+        while True:
+            next_run = time.monotonic() + interval
+            with self._cond:
+                while not self._closed and time.monotonic() < next_run:
+                    self._cond.wait(next_run - time.monotonic())
+                if self._closed:
+                    return
+            try:
+                self.outbox.renew()
+                for message_id, _ in self.outbox.claim_stale():
+                    self._schedule(message_id, 0)
+            except sqlite3.Error as e:
+                print(f"Notification outbox housekeeping failed: {e}")
+
+    # Returns False when the message was rescheduled for another attempt
+    def _deliver(self, message_id):
+        row = self.outbox.get(message_id)
+        if row is None:
+            return True
+        _, chat_id, text, attempts = row
+        self.rate_limiter.wait(chat_id)
+        started = time.perf_counter()
+        try:
+            self.transport.send(chat_id, text)
+        except PermanentError as e:
+            self.outbox.failed(message_id, str(e), dead=True)
+            self._observe('failed', time.perf_counter() - started)
+            print(f"Failed to send notification {message_id}: {e}")
+        except Exception as e:
+            # RetryableError, or anything unexpected from the transport: back off, up to max_attempts
+            attempts += 1
+            if attempts >= self.max_attempts or self._closed:
+                self.outbox.failed(message_id, str(e), dead=attempts >= self.max_attempts)
+                self._observe('failed', time.perf_counter() - started)
+                print(f"Failed to send notification {message_id} after {attempts} attempts: {e}")
+                return True
+            self.outbox.failed(message_id, str(e))
+            self._observe('retry', time.perf_counter() - started)
+            delay = min(self.max_delay, self.base_delay * 2 ** (attempts - 1))
+            retry_after = getattr(e, 'retry_after', None)
+            if retry_after:
+                delay = max(delay, float(retry_after))
+            self._schedule(message_id, delay)
+            return False
+        else:
+            self.outbox.delivered(message_id)
+            self._observe('sent', time.perf_counter() - started)
+            print("Notification sent successfully! 🌟")
+        return True
+
+    # Block until one message is delivered or has failed for good; False on timeout
+    def wait(self, message_id, timeout=None):
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            while message_id in self._unsettled:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._cond.wait(remaining)
+        return True
+
+    # Undelivered messages stay in the outbox and are replayed on the next start
+    def close(self, timeout=5):
+        if self._pid != os.getpid():
+            return
+        with self._cond:
+            self._heap = [entry for entry in self._heap if entry[0] <= time.monotonic()]
+            heapq.heapify(self._heap)
+            self._closed = True
+            self._cond.notify_all()
+        for thread in self._threads:
+            thread.join(timeout)
+        self.outbox.release()
+        self._pid = None
@@ -0,0 +1,167 @@
+import hashlib
+import sqlite3
+import threading
+import time
+
+
+# A limit of `capacity` submissions per `period` seconds as a token bucket: bursts of up to
+# capacity are allowed, and tokens refill continuously at capacity/period per second.
+class Rule:
+    def __init__(self, capacity, period):
+        if capacity <= 0 or period <= 0:
+            raise ValueError(f"Invalid rate limit {capacity}/{period}")
+        self.capacity = capacity
+        self.period = period
+        self.rate = capacity / period
+
+    # "5/600" -> 5 per 600 seconds
+    @classmethod
+    def parse(cls, value):
+        capacity, _, period = value.partition('/')
+        return cls(int(capacity), float(period))
+
+
+# Tokens in a bucket after refilling it up to now
+def _refill(tokens, updated, capacity, rate, now):
+    return min(capacity, tokens + (now - updated) * rate)
+
+
+# Charge one hit against buckets already refilled to now, as [(key, tokens, capacity, rate)].
+# A token is taken from every bucket only if each has one, so a rejected hit drains none of
+# them. Returns the buckets' new tokens and the longest wait among the empty ones (0 if taken).
+def _charge(buckets):
+    wait = max(((1 - tokens) / rate for _, tokens, _, rate in buckets if tokens < 1), default=0.0)
+    if wait:
+        return buckets, wait
+    return [(key, tokens - 1, capacity, rate) for key, tokens, capacity, rate in buckets], 0.0
+
+
+# In-process bucket and duplicate store; each gunicorn worker keeps its own.
+# Stores charge the (key, capacity, rate) buckets of a hit all or nothing and return the longest
+# wait among those that were empty (0 when all had a token).
+class MemoryStore:
+    PRUNE_INTERVAL = 60
+
+    def __init__(self):
+        self._buckets = {}  # key -> (tokens, updated, full_at)
+        self._seen = {}  # key -> expires
+        self._lock = threading.Lock()
+        self._next_prune = 0.0
+
+    def take(self, buckets, now):
+        with self._lock:
+            if now >= self._next_prune:
+                self._prune(now)
+            refilled = []
+            for key, capacity, rate in buckets:
+                tokens, updated, _ = self._buckets.get(key, (capacity, now, now))
+                refilled.append((key, _refill(tokens, updated, capacity, rate, now), capacity, rate))
+            charged, retry_after = _charge(refilled)
+            for key, tokens, capacity, rate in charged:
+                self._buckets[key] = (tokens, now, now + (capacity - tokens) / rate)
+        return retry_after
+
+    def claim(self, key, window, now):
+        with self._lock:
+            if self._seen.get(key, 0.0) > now:
+                return False
+            self._seen[key] = now + window
+            return True
+
+    def release(self, key):
+        with self._lock:
+            self._seen.pop(key, None)
+
+    def _prune(self, now):
+        # A bucket that has refilled is indistinguishable from a missing one
+        self._buckets = {key: bucket for key, bucket in self._buckets.items() if bucket[2] > now}
+        self._seen = {key: expires for key, expires in self._seen.items() if expires > now}
+        self._next_prune = now + self.PRUNE_INTERVAL
+
+
+# Shared store in SQLite so every worker (and process) on the host draws from the same
+# buckets; each take is one BEGIN IMMEDIATE transaction. Rate-limit state is disposable,
+# so commits skip the fsync (synchronous=NORMAL under WAL).
+class SqliteStore:
+    PRUNE_INTERVAL = 60
+
+    def __init__(self, path, timeout=5):
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=timeout, check_same_thread=False, isolation_level=None)
+        if path != ':memory:':
+            self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS rate_buckets (key TEXT PRIMARY KEY, tokens REAL NOT NULL, "
+            "updated REAL NOT NULL, full_at REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE TABLE IF NOT EXISTS rate_seen (key TEXT PRIMARY KEY, expires REAL NOT NULL)")
+        self._next_prune = 0.0
+
+    def take(self, buckets, now):
+        with self._lock:
+            if now >= self._next_prune:
+                self._prune(now)
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                refilled = []
+                for key, capacity, rate in buckets:
+                    row = self._conn.execute("SELECT tokens, updated FROM rate_buckets WHERE key = ?", (key,)).fetchone()
+                    refilled.append((key, _refill(*(row or (capacity, now)), capacity, rate, now), capacity, rate))
+                charged, retry_after = _charge(refilled)
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO rate_buckets (key, tokens, updated, full_at) VALUES (?, ?, ?, ?)",
+                    [(key, tokens, now, now + (capacity - tokens) / rate) for key, tokens, capacity, rate in charged],
+                )
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._conn.execute("COMMIT")
+        return retry_after
+
+    def claim(self, key, window, now):
+        # Inserts, or takes over an expired entry; a live entry leaves the row untouched
+        with self._lock:
+            cursor = self._conn.execute(
+                "INSERT INTO rate_seen (key, expires) VALUES (?, ?) "
+                "ON CONFLICT (key) DO UPDATE SET expires = excluded.expires WHERE rate_seen.expires <= ?",
+                (key, now + window, now),
+            )
+        return cursor.rowcount == 1
+
+    def release(self, key):
+        with self._lock:
+            self._conn.execute("DELETE FROM rate_seen WHERE key = ?", (key,))
+
+    def _prune(self, now):
+        self._conn.execute("DELETE FROM rate_buckets WHERE full_at <= ?", (now,))
+        self._conn.execute("DELETE FROM rate_seen WHERE expires <= ?", (now,))
+        self._next_prune = now + self.PRUNE_INTERVAL
+
+
+# Token-bucket limiter over named rules (e.g. ip, phone, email) plus duplicate suppression.
+# hit() takes one token from the bucket of every given value when all have one and returns 0;
+# otherwise it takes none and returns the seconds until the tightest bucket allows another
+# submission, so a sender blocked by one rule can't drain the others' buckets. claim() returns a
+# key for a submission not seen within dedup_window (release() it if processing fails), or
+# None for a repeat, so an identical resubmission costs nothing.
+class RateLimiter:
+    def __init__(self, rules, store=None, dedup_window=300, clock=time.time):
+        self.rules = rules
+        self.store = store or MemoryStore()
+        self.dedup_window = dedup_window
+        self._clock = clock
+
+    def hit(self, **values):
+        buckets = [
+            (f"{name}:{value}", self.rules[name].capacity, self.rules[name].rate)
+            for name, value in values.items() if value
+        ]
+        return self.store.take(buckets, self._clock())
+
+    def claim(self, *parts):
+        key = 'seen:' + hashlib.sha256('\x1f'.join(str(part) for part in parts).encode()).hexdigest()
+        return key if self.store.claim(key, self.dedup_window, self._clock()) else None
+
+    def release(self, key):
+        self.store.release(key)
@@ -0,0 +1,353 @@
+# Storefront benchmark: serves the app under gunicorn at several worker/thread counts, with
+# SQLite storage in a scratch directory and a local stub standing in for the Telegram API,
+# and drives a weighted mix of shopper sessions (category browsing, add_to_cart bursts,
+# view_cart, checkout, join and contact). Reports p50/p95/p99 latency and throughput per
+# route, saves the results as JSON and, given a baseline, flags routes that got slower.
+#
+#   pip install gunicorn
+#   python scripts/bench.py --configs 1x1,2x4,4x8 --duration 20 --output bench.json
+#   python scripts/bench.py --duration 20 --baseline bench.json    # exits 1 on a regression
+import argparse
+import http.server
+import json
+import os
+import platform
+import random
+import re
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import requests
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+CATEGORY_PAGES = ['/menus', '/health_wellness', '/skincare_personal_care', '/weight_management', '/kids_family', '/combos']
+# Share of sessions per scenario; roughly a storefront where most visitors only browse
+MIX = {'browse': 50, 'shop': 30, 'checkout': 10, 'join': 5, 'contact': 5}
+# Routes whose regressions hurt the most; called out first in the comparison
+HOT_ROUTES = ('POST /add_to_cart', 'POST /checkout')
+IDEMPOTENCY_KEY_PATTERN = re.compile(r'name="idempotency_key" value="([^"]+)"')
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+# Stub Telegram API: accepts every sendMessage after an optional delay
+class StubTelegram(http.server.ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, latency):
+        self.latency = latency
+        super().__init__(('127.0.0.1', 0), StubTelegramHandler)
+
+
+class StubTelegramHandler(http.server.BaseHTTPRequestHandler):
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        time.sleep(self.server.latency)
+        body = b'{"ok": true, "result": {}}'
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class Server:
+    def __init__(self, workers, threads, env):
+        self.workers = workers
+        self.threads = threads
+        self.env = env
+        self.port = free_port()
+        self.url = f"http://127.0.0.1:{self.port}"
+        self.process = None
+
+    def __enter__(self):
+        self.process = subprocess.Popen(
+            [sys.executable, '-m', 'gunicorn', '--workers', str(self.workers), '--threads', str(self.threads),
+             '--bind', f"127.0.0.1:{self.port}", '--log-level', 'warning', 'app:app'],
+            # The app prints per order and notification; keep stderr for tracebacks only
+            cwd=ROOT, env=self.env, stdout=subprocess.DEVNULL,
+        )
+        deadline = time.monotonic() + 30
+        while time.monotonic() < deadline:
+            if self.process.poll() is not None:
+                raise RuntimeError(f"gunicorn exited with status {self.process.returncode}")
+            try:
+                if requests.get(self.url + '/', timeout=1).status_code == 200:
+                    return self
+            except requests.ConnectionError:
+                pass
+            time.sleep(0.1)
+        self.process.kill()
+        raise RuntimeError("gunicorn did not become ready within 30s")
+
+    def __exit__(self, *exc):
+        self.process.terminate()
+        try:
+            self.process.wait(timeout=15)
+        except subprocess.TimeoutExpired:
+            self.process.kill()
+            self.process.wait()
+
+
+# One simulated shopper: a cookie-carrying session that runs scenarios until the deadline
+class Shopper:
+    def __init__(self, base_url, products, packages, rng, record):
+        self.base_url = base_url
+        self.products = products
+        self.packages = packages
+        self.rng = rng
+        self.record = record
+        self.session = requests.Session()
+
+    def call(self, method, path, **kwargs):
+        started = time.perf_counter()
+        try:
+            response = self.session.request(method, self.base_url + path, timeout=30, **kwargs)
+            status = response.status_code
+        except requests.RequestException:
+            response, status = None, 0
+        self.record(f"{method} {path}", time.perf_counter() - started, status)
+        return response
+
+    def contact_details(self):
+        n = self.rng.randrange(10 ** 6)
+        return {"name": f"Bench {n}", "phone": f"07{n:08d}", "email": f"bench{n}@example.com"}
+
+    def add_items(self, count):
+        for _ in range(count):
+            product = self.rng.choice(self.products)
+            self.call('POST', '/add_to_cart', data={"product_id": product, "quantity": self.rng.randint(1, 3)})
+
+    def browse(self):
+        for path in self.rng.sample(CATEGORY_PAGES, self.rng.randint(1, 3)):
+            self.call('GET', path)
+
+    def shop(self):
+        self.call('GET', self.rng.choice(CATEGORY_PAGES))
+        self.add_items(self.rng.randint(2, 6))
+        self.call('GET', '/api/cart')
+        self.call('GET', '/view_cart')
+
+    def checkout(self):
+        self.add_items(self.rng.randint(1, 3))
+        self.call('GET', '/view_cart')
+        page = self.call('GET', '/checkout')
+        match = IDEMPOTENCY_KEY_PATTERN.search(page.text) if page is not None else None
+        form = dict(self.contact_details(), payment_method=self.rng.choice(['Cash send', 'E-wallet']))
+        if match:
+            form['idempotency_key'] = match.group(1)
+        self.call('POST', '/checkout', data=form)
+
+    def join(self):
+        form = dict(self.contact_details(), package=self.rng.choice(self.packages))
+        self.call('POST', '/join', data=form)
+
+    def contact(self):
+        form = dict(self.contact_details(), message="Benchmark message, please ignore")
+        self.call('POST', '/contact', data=form)
+
+    def run(self, deadline):
+        scenarios, weights = zip(*MIX.items())
+        while time.monotonic() < deadline:
+            getattr(self, self.rng.choices(scenarios, weights)[0])()
+
+
+def run_load(base_url, clients, duration, warmup, seed, products, packages):
+    samples = []
+    lock = threading.Lock()
+    measuring = threading.Event()
+
+    def record(label, seconds, status):
+        if measuring.is_set():
+            with lock:
+                samples.append((label, seconds, status))
+
+    started = time.monotonic()
+    deadline = started + warmup + duration
+    shoppers = [Shopper(base_url, products, packages, random.Random(seed + i), record) for i in range(clients)]
+    threads = [threading.Thread(target=shopper.run, args=(deadline,)) for shopper in shoppers]
+    for thread in threads:
+        thread.start()
+    time.sleep(warmup)
+    measuring.set()
+    measured_from = time.monotonic()
+    for thread in threads:
+        thread.join()
+    return samples, time.monotonic() - measured_from
+
+
+# Every request in the mix is expected to succeed, so any 4xx or 5xx (or a failed connection)
+# is an error; latency percentiles cover successful responses only
+def is_error(status):
+    return status == 0 or status >= 400
+
+
+def summarize(samples, elapsed):
+    by_route = {}
+    for label, seconds, status in samples:
+        by_route.setdefault(label, []).append((seconds, status))
+    routes = {}
+    for label, entries in sorted(by_route.items()):
+        latencies = [seconds * 1000 for seconds, status in entries if not is_error(status)]
+        routes[label] = {
+            "requests": len(entries),
+            "errors": sum(1 for _, status in entries if is_error(status)),
+            "rps": len(entries) / elapsed,
+            "p50_ms": percentile(latencies, 50) if latencies else None,
+            "p95_ms": percentile(latencies, 95) if latencies else None,
+            "p99_ms": percentile(latencies, 99) if latencies else None,
+        }
+    return {
+        "requests": len(samples),
+        "errors": sum(route["errors"] for route in routes.values()),
+        "rps": len(samples) / elapsed,
+        "routes": routes,
+    }
+
+
+def format_ms(value):
+    return '-' if value is None else f"{value:.1f}"
+
+
+def print_summary(name, summary):
+    print(f"\n{name}: {summary['requests']} requests, {summary['rps']:.0f} req/s, {summary['errors']} errors")
+    print(f"  {'route':<32}{'reqs':>7}{'req/s':>8}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'errors':>8}")
+    for label, route in summary['routes'].items():
+        print(f"  {label:<32}{route['requests']:>7}{route['rps']:>8.1f}{format_ms(route['p50_ms']):>9}"
+              f"{format_ms(route['p95_ms']):>9}{format_ms(route['p99_ms']):>9}{route['errors']:>8}")
+
+
+# A route regresses when its p95 grows by more than the tolerance (and by at least min_ms, so
+# sub-millisecond noise on cached pages is ignored) or when it starts returning errors
+def compare(results, baseline, tolerance, min_ms):
+    regressions = []
+    for name, summary in results['configs'].items():
+        base = baseline.get('configs', {}).get(name)
+        if base is None:
+            continue
+        labels = sorted(summary['routes'], key=lambda label: (label not in HOT_ROUTES, label))
+        for label in labels:
+            route, base_route = summary['routes'][label], base['routes'].get(label)
+            if base_route is None:
+                continue
+            p95, base_p95 = route['p95_ms'], base_route['p95_ms']
+            if p95 is not None and base_p95 is not None and p95 > base_p95 * (1 + tolerance) and p95 - base_p95 >= min_ms:
+                regressions.append(f"{name} {label}: p95 {base_p95:.1f}ms -> {p95:.1f}ms")
+            if route['errors'] > base_route['errors']:
+                regressions.append(f"{name} {label}: errors {base_route['errors']} -> {route['errors']}")
+        if summary['rps'] < base['rps'] * (1 - tolerance):
+            regressions.append(f"{name} throughput: {base['rps']:.0f} -> {summary['rps']:.0f} req/s")
+    return regressions
+
+
+def parse_configs(value):
+    configs = []
+    for entry in value.split(','):
+        workers, _, threads = entry.strip().partition('x')
+        configs.append((int(workers), int(threads or 1)))
+    return configs
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--configs', default='1x1,2x4,4x4', help="comma-separated gunicorn WORKERSxTHREADS")
+    parser.add_argument('--clients', type=int, default=16, help="concurrent simulated shoppers")
+    parser.add_argument('--duration', type=float, default=15, help="measured seconds per config")
+    parser.add_argument('--warmup', type=float, default=3, help="unmeasured seconds before each run")
+    parser.add_argument('--notify-latency', type=float, default=0.05, help="stub Telegram response time in seconds")
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--output', help="write results as JSON to this file")
+    parser.add_argument('--baseline', help="JSON results of an earlier run to compare against")
+    parser.add_argument('--tolerance', type=float, default=0.2, help="allowed relative slowdown before flagging")
+    parser.add_argument('--min-ms', type=float, default=2.0, help="ignore p95 increases smaller than this")
+    args = parser.parse_args()
+
+    try:
+        import gunicorn  # noqa: F401
+    except ImportError:
+        sys.exit("gunicorn is required: pip install gunicorn")
+
+    os.environ.setdefault('STORAGE_BACKEND', 'memory')
+    # Workers must share the session signing key or carts vanish between them
+    os.environ.setdefault('SECRET_KEY', 'bench-session-key')
+    os.environ.setdefault('PUBLIC_BASE_URL', 'http://127.0.0.1')
+    from app import catalog, menu
+    products = sorted(catalog.by_id)
+    packages = [option['name'] for option in menu['Join Options']]
+
+    stub = StubTelegram(args.notify_latency)
+    threading.Thread(target=stub.serve_forever, daemon=True).start()
+    scratch = tempfile.mkdtemp(prefix='forever-zama-bench-')
+
+    results = {
+        "meta": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "started": time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+            "clients": args.clients,
+            "duration": args.duration,
+            "mix": MIX,
+            "seed": args.seed,
+        },
+        "configs": {},
+    }
+    for workers, threads in parse_configs(args.configs):
+        name = f"{workers}x{threads}"
+        # Fresh SQLite storage per run; it is shared by every worker, so carts survive
+        # requests landing on different workers the way they do with Firestore
+        env = dict(
+            os.environ,
+            STORAGE_BACKEND='sqlite',
+            SQLITE_PATH=os.path.join(scratch, f"{name}.sqlite3"),
+            NOTIFY_OUTBOX_PATH=os.path.join(scratch, f"{name}-outbox.sqlite3"),
+            TELEGRAM_API_URL=f"http://127.0.0.1:{stub.server_address[1]}",
+            # Every simulated shopper comes from 127.0.0.1; measure the forms, not the spam limits
+            FORM_RATE_LIMIT_IP='1000000/1',
+            FORM_RATE_LIMIT_CONTACT='1000000/1',
+            PYTHONDONTWRITEBYTECODE='1',
+        )
+        with Server(workers, threads, env) as server:
+            samples, elapsed = run_load(server.url, args.clients, args.duration, args.warmup, args.seed, products, packages)
+        summary = dict(summarize(samples, elapsed), workers=workers, threads=threads)
+        results['configs'][name] = summary
+        print_summary(f"gunicorn {workers} workers x {threads} threads", summary)
+    stub.shutdown()
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+        print(f"\nResults written to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            regressions = compare(results, json.load(f), args.tolerance, args.min_ms)
+        print(f"\nCompared with {args.baseline} (tolerance {args.tolerance:.0%}, min {args.min_ms:g}ms)")
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        if not regressions:
+            print("ok   no regressions")
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,178 @@
+# Build-time image pipeline: resizes every image under static/images into several widths,
+# encodes AVIF and WebP plus a JPEG (PNG for transparent images) fallback, names each file
+# by content hash for immutable caching and writes static/images/build/manifest.json for
+# the responsive_image template helper. Finishes with a per-page byte-savings report.
+#
+# The Vercel deployment in vercel.json has no build step, so the output is committed and ships
+# with every deploy: rerun this and commit static/images/build/ whenever an image under
+# static/images is added or changed. An image missing from the manifest is served as is.
+#
+#   pip install Pillow      # AVIF needs Pillow >= 11.2 (or pillow-avif-plugin)
+#   python scripts/build_images.py
+import argparse
+import hashlib
+import io
+import json
+import os
+import shutil
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+IMAGES_DIR = os.path.join(ROOT, 'static', 'images')
+BUILD_DIR = os.path.join(IMAGES_DIR, 'build')
+
+sys.path.insert(0, ROOT)
+
+try:
+    from PIL import Image, features
+except ImportError:
+    sys.exit("Pillow is required: pip install Pillow")
+
+# Target widths per image, covering 1x/2x/3x screens at the size the CSS renders them.
+# Product photos sit in a 192px-high box (h-48), so they never display wider than ~256px.
+WIDTHS = {
+    'products/': (256, 512, 768),
+    'zama.jpg': (200, 400),
+    'logo.png': (64, 128),
+}
+QUALITY = {'avif': 50, 'webp': 75, 'jpeg': 80}
+
+
+def target_widths(src, original_width):
+    for prefix, widths in WIDTHS.items():
+        if src.startswith(prefix):
+            break
+    else:
+        widths = (original_width,)
+    # Never upscale; the original width stands in for anything larger
+    return sorted({min(width, original_width) for width in widths})
+
+
+def encode(image, fmt):
+    buffer = io.BytesIO()
+    if fmt == 'jpeg':
+        image.convert('RGB').save(buffer, 'JPEG', quality=QUALITY['jpeg'], optimize=True, progressive=True)
+    elif fmt == 'png':
+        image.save(buffer, 'PNG', optimize=True)
+    elif fmt == 'webp':
+        image.save(buffer, 'WEBP', quality=QUALITY['webp'], method=6)
+    else:
+        image.save(buffer, 'AVIF', quality=QUALITY['avif'])
+    return buffer.getvalue()
+
+
+def write_variant(src, width, fmt, data):
+    stem = os.path.splitext(src)[0].replace('/', '-')
+    extension = 'jpg' if fmt == 'jpeg' else fmt
+    filename = f"{stem}-{width}.{hashlib.sha256(data).hexdigest()[:10]}.{extension}"
+    with open(os.path.join(BUILD_DIR, filename), 'wb') as f:
+        f.write(data)
+    return {"file": filename, "width": width, "bytes": len(data)}
+
+
+def build_image(src, formats):
+    path = os.path.join(IMAGES_DIR, src)
+    with Image.open(path) as original:
+        original.load()
+    has_alpha = original.mode in ('RGBA', 'LA') or 'transparency' in original.info
+    fallback = 'png' if has_alpha else 'jpeg'
+    variants = {fmt: [] for fmt in formats}
+    variants['fallback'] = []
+    for width in target_widths(src, original.width):
+        height = round(original.height * width / original.width)
+        resized = original if width == original.width else original.resize((width, height), Image.LANCZOS)
+        if not has_alpha:
+            resized = resized.convert('RGB')
+        for fmt in formats:
+            variants[fmt].append(write_variant(src, width, fmt, encode(resized, fmt)))
+        variants['fallback'].append(write_variant(src, width, fallback, encode(resized, fallback)))
+    return {
+        "width": original.width,
+        "height": original.height,
+        "bytes": os.path.getsize(path),
+        "variants": variants,
+    }
+
+
+def sources():
+    for directory, _, filenames in os.walk(IMAGES_DIR):
+        if os.path.abspath(directory).startswith(BUILD_DIR):
+            continue
+        for filename in sorted(filenames):
+            if filename.lower().endswith(('.jpg', '.jpeg', '.png')):
+                yield os.path.relpath(os.path.join(directory, filename), IMAGES_DIR).replace(os.sep, '/')
+
+
+# Bytes a browser downloads for one image: the original, or the 2x variant in its best format
+def fetched_bytes(entry, fmt, dpr_width):
+    if entry is None:
+        return 0
+    if fmt == 'original':
+        return entry['bytes']
+    variants = entry['variants'].get(fmt) or entry['variants']['fallback']
+    for variant in variants:
+        if variant['width'] >= dpr_width:
+            return variant['bytes']
+    return variants[-1]['bytes']
+
+
+def report(manifest):
+    os.environ.setdefault('STORAGE_BACKEND', 'memory')
+    os.environ.setdefault('SECRET_KEY', 'build-images-report')
+    os.environ.setdefault('PUBLIC_BASE_URL', 'http://localhost:5000')
+    from app import catalog
+    pages = {'home': ['zama.jpg']}
+    for category, products in catalog.categories.items():
+        # Join Options are packages on the join page, which shows no product images
+        if category == 'Join Options':
+            continue
+        endpoint = category.lower().replace(' & ', '_').replace(' ', '_')
+        pages[endpoint] = [f"products/{product['id']}.jpg" for product in products]
+    print(f"\n{'page':<26}{'images':>7}{'original':>12}{'avif @2x':>12}{'webp @2x':>12}{'jpeg @2x':>12}{'saved':>8}")
+    for page, images in pages.items():
+        # Every page also loads the nav logo
+        images = images + ['logo.png']
+        totals = {}
+        for fmt in ('original', 'avif', 'webp', 'fallback'):
+            totals[fmt] = 0
+            for src in images:
+                dpr_width = 2 * WIDTHS.get(src, WIDTHS['products/'])[0]
+                totals[fmt] += fetched_bytes(manifest.get(src), fmt, dpr_width)
+        best = min(value for fmt, value in totals.items() if fmt != 'original' and value)
+        saved = 1 - best / totals['original'] if totals['original'] else 0
+        print(f"{page:<26}{len(images):>7}{totals['original'] / 1024:>10.0f}KB{totals['avif'] / 1024:>10.0f}KB"
+              f"{totals['webp'] / 1024:>10.0f}KB{totals['fallback'] / 1024:>10.0f}KB{saved:>8.0%}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--no-avif', action='store_true', help="skip AVIF even if Pillow supports it")
+    parser.add_argument('--report-only', action='store_true', help="print the savings report for the existing build")
+    args = parser.parse_args()
+
+    manifest_path = os.path.join(BUILD_DIR, 'manifest.json')
+    if args.report_only:
+        with open(manifest_path, encoding='utf-8') as f:
+            report(json.load(f))
+        return
+
+    formats = ['webp']
+    if not args.no_avif and features.check('avif'):
+        formats.insert(0, 'avif')
+    elif not args.no_avif:
+        print("AVIF encoding not available in this Pillow build; building WebP and fallback only")
+
+    # Rebuild from scratch so stale hashed files don't accumulate
+    shutil.rmtree(BUILD_DIR, ignore_errors=True)
+    os.makedirs(BUILD_DIR)
+    manifest = {}
+    for src in sources():
+        manifest[src] = build_image(src, formats)
+        print(f"built {src}")
+    with open(manifest_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=1, sort_keys=True)
+    report(manifest)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,179 @@
+# Storage conformance checks: every backend must behave identically.
+#
+#   python scripts/check_storage.py                  # memory + sqlite
+#   FIRESTORE_EMULATOR_HOST=localhost:8080 GOOGLE_CLOUD_PROJECT=demo-zama \
+#       python scripts/check_storage.py firestore
+#
+# The checks expire every cart and write orders, so firestore only runs against the emulator.
+import os
+import sys
+import tempfile
+import threading
+import time
+import uuid
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from storage import create_storage, cart_items
+
+LITE = {"id": "forever_lite", "name": "Forever Lite", "price": 650.21}
+LIPS = {"id": "aloe_lips", "name": "Aloe Lips", "price": 74.80}
+
+
+def new_cart_id():
+    return uuid.uuid4().hex
+
+
+def check_empty_cart(storage):
+    cart = storage.get_cart(new_cart_id())
+    assert cart["lines"] == {} and cart["count"] == 0 and cart["total"] == 0
+
+
+def check_add_merges_lines(storage):
+    cart_id = new_cart_id()
+    storage.add_to_cart(cart_id, LITE, 2)
+    storage.add_to_cart(cart_id, LITE, 1)
+    storage.add_to_cart(cart_id, LIPS, 1)
+    cart = storage.get_cart(cart_id)
+    assert set(cart["lines"]) == {"forever_lite", "aloe_lips"}
+    assert cart["lines"]["forever_lite"]["quantity"] == 3
+    assert round(cart["lines"]["forever_lite"]["total"], 2) == 1950.63
+    assert cart["count"] == 4
+    assert cart["total"] == 2025.43
+    assert {item["product_id"] for item in cart_items(cart)} == {"forever_lite", "aloe_lips"}
+
+
+def check_carts_are_isolated(storage):
+    first, second = new_cart_id(), new_cart_id()
+    storage.add_to_cart(first, LITE, 1)
+    assert storage.get_cart(second)["lines"] == {}
+
+
+def check_remove(storage):
+    cart_id = new_cart_id()
+    storage.add_to_cart(cart_id, LITE, 1)
+    storage.add_to_cart(cart_id, LIPS, 2)
+    updated = storage.remove_from_cart(cart_id, "aloe_lips")
+    assert list(updated["lines"]) == ["forever_lite"]
+    assert updated["count"] == 1 and updated["total"] == 650.21
+    assert storage.remove_from_cart(cart_id, "aloe_lips") is None
+    assert storage.remove_from_cart(new_cart_id(), "aloe_lips") is None
+    cart = storage.get_cart(cart_id)
+    assert list(cart["lines"]) == ["forever_lite"]
+    assert cart["count"] == 1 and cart["total"] == 650.21
+
+
+def check_clear(storage):
+    cart_id = new_cart_id()
+    storage.add_to_cart(cart_id, LITE, 1)
+    storage.clear_cart(cart_id)
+    storage.clear_cart(cart_id)
+    assert storage.get_cart(cart_id)["lines"] == {}
+
+
+def check_concurrent_adds(storage):
+    cart_id = new_cart_id()
+    threads = [threading.Thread(target=storage.add_to_cart, args=(cart_id, LIPS, 1)) for _ in range(20)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    cart = storage.get_cart(cart_id)
+    assert cart["lines"]["aloe_lips"]["quantity"] == 20
+    assert cart["count"] == 20
+
+
+def check_expire_carts(storage):
+    stale, fresh = new_cart_id(), new_cart_id()
+    storage.add_to_cart(stale, LITE, 1)
+    storage.expire_carts()
+    assert storage.get_cart(stale)["count"] == 1
+    removed = storage.expire_carts(now=time.time() + storage.cart_ttl + 60)
+    assert removed >= 1
+    assert storage.get_cart(stale)["lines"] == {}
+    storage.add_to_cart(fresh, LIPS, 1)
+    assert storage.get_cart(fresh)["count"] == 1
+
+
+def check_place_order(storage):
+    first_key, second_key = new_cart_id(), new_cart_id()
+    first, created = storage.place_order(first_key, {"total": 650.21, "items": [{"name": "Forever Lite"}]})
+    assert created and first["idempotency_key"] == first_key
+    assert first["order_number"] == f"#{first['sequence']:04d}"
+    repeat, created = storage.place_order(first_key, {"total": 1.00})
+    assert not created and repeat["sequence"] == first["sequence"] and repeat["total"] == 650.21
+    second, created = storage.place_order(second_key, {"total": 74.80})
+    assert created and second["sequence"] == first["sequence"] + 1
+    assert storage.get_order(second_key)["order_number"] == second["order_number"]
+    assert storage.get_order(new_cart_id()) is None
+
+
+def check_place_order_clears_cart(storage):
+    cart_id, key = new_cart_id(), new_cart_id()
+    build_order = lambda cart: {"total": float(cart["count"])} if cart["count"] else None
+    assert storage.place_cart_order(key, cart_id, build_order) == (None, False)
+    storage.add_to_cart(cart_id, LIPS, 2)
+    order, created = storage.place_cart_order(key, cart_id, build_order)
+    # The order is built from the cart read inside the transaction
+    assert created and order["total"] == 2.0 and storage.get_cart(cart_id)["lines"] == {}
+    # A replayed key must not touch the cart the customer has started since
+    storage.add_to_cart(cart_id, LIPS, 1)
+    order, created = storage.place_cart_order(key, cart_id, build_order)
+    assert not created and order["total"] == 2.0 and storage.get_cart(cart_id)["count"] == 1
+
+
+def check_concurrent_orders(storage):
+    keys = [new_cart_id() for _ in range(10)]
+    results = []
+    threads = [threading.Thread(target=lambda key=key: results.append(storage.place_order(key, {"total": 1.0})))
+               for key in keys + keys]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    created = [order["sequence"] for order, was_created in results if was_created]
+    assert len(created) == len(set(created)) == len(keys)
+    assert {order["sequence"] for order, _ in results} == set(created)
+
+
+def check_records(storage):
+    ids = {
+        storage.add_join_request({"name": "A", "package": "Full Stock"}),
+        storage.add_contact({"name": "A", "message": "Hi"}),
+    }
+    assert len(ids) == 2 and all(ids)
+
+
+CHECKS = [value for name, value in sorted(globals().items()) if name.startswith('check_')]
+
+
+def backends(names):
+    for name in names:
+        if name == 'sqlite':
+            yield name, create_storage('sqlite', sqlite_path=os.path.join(tempfile.mkdtemp(), 'conformance.sqlite3'))
+        elif name == 'firestore':
+            if not os.environ.get('FIRESTORE_EMULATOR_HOST'):
+                sys.exit("Refusing to run against a live Firestore project: set FIRESTORE_EMULATOR_HOST")
+            from firebase_admin import initialize_app, firestore
+            initialize_app()
+            yield name, create_storage('firestore', db=firestore.client())
+        else:
+            yield name, create_storage(name)
+
+
+def main(names):
+    failures = 0
+    for name, storage in backends(names):
+        for check in CHECKS:
+            try:
+                check(storage)
+            except Exception as e:
+                failures += 1
+                print(f"FAIL {name} {check.__name__}: {e!r}")
+            else:
+                print(f"ok   {name} {check.__name__}")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:] or ['memory', 'sqlite']))
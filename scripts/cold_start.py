@@ -0,0 +1,68 @@
+# Cold-start timing harness: imports the app in fresh interpreters and reports
+# import time and time to first byte for GET / (measured in-process through WSGI).
+#
+#   python scripts/cold_start.py --runs 10
+#   STORAGE_BACKEND=firestore python scripts/cold_start.py
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+CHILD = """
+import json, time
+started = time.perf_counter()
+import app
+imported = time.perf_counter()
+client = app.app.test_client()
+response = client.get('/', buffered=False)
+first_chunk = next(iter(response.response), b'')
+first_byte = time.perf_counter()
+print(json.dumps({
+    "import_ms": (imported - started) * 1000,
+    "ttfb_ms": (first_byte - imported) * 1000,
+    "total_ms": (first_byte - started) * 1000,
+    "status": response.status_code,
+}))
+"""
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+def run_once(env):
+    output = subprocess.run([sys.executable, '-c', CHILD], cwd=ROOT, env=env, capture_output=True, text=True, check=True)
+    return json.loads(output.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--backend', default=os.environ.get('STORAGE_BACKEND', 'memory'))
+    parser.add_argument('--json', action='store_true', help="print raw results as JSON")
+    args = parser.parse_args()
+
+    env = dict(os.environ, STORAGE_BACKEND=args.backend, PYTHONDONTWRITEBYTECODE='1')
+    env.setdefault('SECRET_KEY', 'cold-start-session-key')
+    env.setdefault('PUBLIC_BASE_URL', 'http://localhost:5000')
+    results = [run_once(env) for _ in range(args.runs)]
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    print(f"Cold start over {args.runs} runs (backend: {args.backend})")
+    for key in ('import_ms', 'ttfb_ms', 'total_ms'):
+        values = [result[key] for result in results]
+        print(f"  {key:<10} median {statistics.median(values):8.1f}  p95 {percentile(values, 95):8.1f}  max {max(values):8.1f}")
+    statuses = {result['status'] for result in results}
+    if statuses != {200}:
+        print(f"  unexpected status codes: {sorted(statuses)}")
+
+
+if __name__ == "__main__":
+    main()
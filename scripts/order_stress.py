@@ -0,0 +1,170 @@
+# Checkout stress test: several processes check out carts concurrently against one ledger (as
+# gunicorn workers or serverless instances would) through place_cart_order, the transaction
+# checkout uses: cart read, order, sequence bump and cart delete. Every order must get a unique,
+# gap-free number and be built from its cart, and every cart must be ordered exactly once and
+# then be gone. A share of carts is also submitted by the partner process at the same moment,
+# standing in for double-submitted forms: with the same idempotency key that must come back with
+# the original order, with another key (a second tab) it must find the cart already ordered.
+# Transactions that give up under contention (Firestore retries a transaction 5 times, all
+# against the single counters/orders document) are counted as aborted.
+#
+#   python scripts/order_stress.py --processes 8 --orders 200
+#   FIRESTORE_EMULATOR_HOST=localhost:8080 GOOGLE_CLOUD_PROJECT=demo-zama \
+#       python scripts/order_stress.py --backend firestore --processes 8 --orders 50
+import argparse
+import collections
+import multiprocessing
+import os
+import random
+import sys
+import tempfile
+import time
+import uuid
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from storage import cart_items, create_storage
+
+PRODUCT = {"id": "forever_lite", "name": "Forever Lite", "price": 650.21}
+
+
+def firestore_client():
+    from firebase_admin import firestore, initialize_app
+    initialize_app()
+    return firestore.client()
+
+
+def open_storage(backend, path):
+    if backend == 'firestore':
+        return create_storage('firestore', client_factory=firestore_client)
+    return create_storage('sqlite', sqlite_path=path)
+
+
+# Orders exactly what the cart held when the transaction read it
+def build_order(cart):
+    items = cart_items(cart)
+    if not items:
+        return None
+    return {"items": items, "quantity": sum(item["quantity"] for item in items)}
+
+
+# Cart IDs and keys carry the run ID so repeated runs against one emulator never collide
+def cart_name(run_id, worker_id, i):
+    return f"{run_id}-worker{worker_id:03d}-cart{i:06d}"
+
+
+def cart_quantity(i):
+    return i % 5 + 1
+
+
+def worker(backend, path, run_id, worker_id, orders, duplicate_rate, start, results):
+    storage = open_storage(backend, path)
+    rng = random.Random(worker_id)
+    placed = []
+    aborted = []
+    start.wait()
+    for i in range(orders):
+        cart_id = cart_name(run_id, worker_id, i)
+        storage.add_to_cart(cart_id, PRODUCT, cart_quantity(i))
+        submissions = [(cart_id, f"{cart_id}-key")]
+        if rng.random() < duplicate_rate:
+            # Resubmit the partner worker's cart at the same moment it checks it out, either as a
+            # replay of its form (same key) or from a second tab (a key of its own)
+            partner_cart = cart_name(run_id, worker_id ^ 1, i)
+            key = f"{partner_cart}-key" if rng.random() < 0.5 else f"{partner_cart}-tab{worker_id:03d}"
+            submissions.append((partner_cart, key))
+        for cart_id, key in submissions:
+            try:
+                order, created = storage.place_cart_order(key, cart_id, build_order)
+            except Exception as e:
+                aborted.append((cart_id, key, f"{type(e).__name__}: {e}"))
+                continue
+            placed.append((cart_id, key, order and order["sequence"], order and order["quantity"], created))
+    results.put((placed, aborted))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--processes', type=int, default=8, help="use an even number so every worker has a partner")
+    parser.add_argument('--orders', type=int, default=200, help="orders per process")
+    parser.add_argument('--duplicate-rate', type=float, default=0.2, help="share of carts submitted twice")
+    parser.add_argument('--backend', choices=['sqlite', 'firestore'], default='sqlite',
+                        help="firestore runs against FIRESTORE_EMULATOR_HOST only")
+    parser.add_argument('--database', help="SQLite file to use (default: a fresh temporary file)")
+    args = parser.parse_args()
+    if args.backend == 'firestore' and not os.environ.get('FIRESTORE_EMULATOR_HOST'):
+        sys.exit("Refusing to write test carts and orders to a live Firestore project: set FIRESTORE_EMULATOR_HOST")
+
+    path = args.database or os.path.join(tempfile.mkdtemp(), 'order_stress.sqlite3')
+    if args.backend == 'sqlite':
+        open_storage('sqlite', path)  # create the schema before the workers race for it
+    run_id = uuid.uuid4().hex[:8]
+
+    results = multiprocessing.Queue()
+    start = multiprocessing.Event()
+    processes = [
+        multiprocessing.Process(target=worker, args=(args.backend, path, run_id, i, args.orders, args.duplicate_rate, start, results))
+        for i in range(args.processes)
+    ]
+    for process in processes:
+        process.start()
+    started = time.perf_counter()
+    start.set()
+    placed, aborted = [], []
+    for _ in processes:
+        worker_placed, worker_aborted = results.get()
+        placed.extend(worker_placed)
+        aborted.extend(worker_aborted)
+    elapsed = time.perf_counter() - started
+    for process in processes:
+        process.join()
+
+    created = [(cart_id, sequence) for cart_id, _, sequence, _, was_created in placed if was_created]
+    sequences = sorted(sequence for _, sequence in created)
+    by_key = {}
+    for _, key, sequence, _, _ in placed:
+        if sequence is not None:
+            by_key.setdefault(key, set()).add(sequence)
+    ordered = collections.Counter(cart_id for cart_id, _ in created)
+    # Every cart checked out successfully at least once must have been ordered exactly once
+    carts = {cart_id for cart_id, _, _, _, _ in placed}
+
+    failures = []
+    if len(created) != len(carts):
+        failures.append(f"expected {len(carts)} new orders, got {len(created)}")
+    if any(count > 1 for count in ordered.values()):
+        failures.append(f"{sum(count > 1 for count in ordered.values())} carts were ordered more than once")
+    wrong = sum(1 for cart_id, _, _, quantity, was_created in placed
+                if was_created and quantity != cart_quantity(int(cart_id.rsplit('cart', 1)[1])))
+    if wrong:
+        failures.append(f"{wrong} orders do not match the cart they were placed from")
+    storage = open_storage(args.backend, path)
+    left = sum(1 for cart_id in ordered if storage.get_cart(cart_id)["lines"])
+    if left:
+        failures.append(f"{left} ordered carts were not deleted")
+    lost = {cart_id for cart_id, _, _ in aborted} - carts
+    if aborted:
+        reasons = collections.Counter(reason for _, _, reason in aborted)
+        failures.append(f"{len(aborted)} submissions aborted ({len(lost)} carts never ordered): "
+                        + "; ".join(f"{count} x {reason}" for reason, count in reasons.most_common(3)))
+    if len(set(sequences)) != len(sequences):
+        failures.append("duplicate order numbers allocated")
+    if sequences and sequences != list(range(sequences[0], sequences[0] + len(sequences))):
+        failures.append("order numbers are not contiguous")
+    if any(len(numbers) != 1 for numbers in by_key.values()):
+        failures.append("a resubmitted idempotency key received a different order number")
+
+    submissions = len(placed) + len(aborted)
+    print(f"{submissions} submissions ({len(aborted)} aborted), {len(created)} orders from {args.processes} "
+          f"{args.backend} processes in {elapsed:.2f}s ({submissions / elapsed:.0f} submissions/s)")
+    for failure in failures:
+        print(f"FAIL {failure}")
+    if not failures and sequences:
+        print(f"ok   order numbers #{sequences[0]:04d}..#{sequences[-1]:04d} unique and contiguous, "
+              f"{len(ordered)} carts each ordered once and deleted")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,65 @@
+# Rate limiter microbenchmark: per-call cost of RateLimiter.hit() (three buckets: ip, phone,
+# email) and of the duplicate check, for the in-process store and the shared SQLite store.
+#
+#   python scripts/ratelimit_bench.py --calls 50000 --keys 1000
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from ratelimit import MemoryStore, RateLimiter, Rule, SqliteStore
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+def measure(call, arguments):
+    timings = []
+    for args in arguments:
+        started = time.perf_counter_ns()
+        call(*args)
+        timings.append((time.perf_counter_ns() - started) / 1000)
+    return timings
+
+
+def report(label, timings):
+    print(f"  {label:<28}mean {sum(timings) / len(timings):7.2f}us  p50 {percentile(timings, 50):7.2f}us  "
+          f"p99 {percentile(timings, 99):7.2f}us")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--calls', type=int, default=20000)
+    parser.add_argument('--keys', type=int, default=1000, help="distinct visitors the calls are spread over")
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    visitors = [(f"10.0.{i // 256}.{i % 256}", f"07{i:08d}", f"visitor{i}@example.com") for i in range(args.keys)]
+    hits = [rng.choice(visitors) for _ in range(args.calls)]
+    # Half the submissions repeat an earlier one, as a double-clicked or bot-replayed form would
+    submissions = [('contact',) + rng.choice(visitors) + (f"message {rng.randrange(args.calls // 2)}",) for _ in range(args.calls)]
+    rules = {'ip': Rule(10, 600), 'phone': Rule(3, 3600), 'email': Rule(3, 3600)}
+
+    stores = {
+        'memory': MemoryStore(),
+        'sqlite': SqliteStore(os.path.join(tempfile.mkdtemp(), 'ratelimit.sqlite3')),
+    }
+    print(f"{args.calls} calls over {args.keys} visitors")
+    for name, store in stores.items():
+        limiter = RateLimiter(rules, store)
+        print(f"{name} store")
+        report("hit (ip + phone + email)", measure(lambda ip, phone, email: limiter.hit(ip=ip, phone=phone, email=email), hits))
+        report("claim (duplicate check)", measure(limiter.claim, submissions))
+
+
+if __name__ == "__main__":
+    main()
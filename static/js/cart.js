@@ -0,0 +1,106 @@
+// Cart updates without page reloads: keeps the nav cart badge and the cart page in sync
+// from the small JSON responses of /add_to_cart, /remove_from_cart, /clear_cart and /api/cart.
+(function () {
+    const COUNT_KEY = 'cartCount';
+
+    function formatPrice(value) {
+        return Number(value).toFixed(2);
+    }
+
+    function setCount(count) {
+        sessionStorage.setItem(COUNT_KEY, String(count));
+        document.querySelectorAll('[data-cart-count]').forEach(badge => {
+            badge.textContent = count;
+            badge.hidden = count <= 0;
+        });
+    }
+
+    function cachedCount() {
+        const value = sessionStorage.getItem(COUNT_KEY);
+        return value === null ? null : Number(value);
+    }
+
+    // Re-render the cart page lines and total from a cart state ({items, count, total})
+    function render(cart) {
+        setCount(cart.count);
+        const list = document.querySelector('[data-cart-lines]');
+        if (!list) {
+            return;
+        }
+        const present = new Set(cart.items.map(item => item.product_id));
+        list.querySelectorAll('[data-cart-line]').forEach(line => {
+            if (!present.has(line.dataset.cartLine)) {
+                line.remove();
+            }
+        });
+        document.querySelectorAll('[data-cart-total]').forEach(total => {
+            total.textContent = formatPrice(cart.total);
+        });
+        document.querySelectorAll('[data-cart-filled]').forEach(el => { el.hidden = cart.items.length === 0; });
+        document.querySelectorAll('[data-cart-empty]').forEach(el => { el.hidden = cart.items.length > 0; });
+    }
+
+    async function refresh() {
+        const response = await fetch('/api/cart', { credentials: 'same-origin' });
+        if (response.ok) {
+            render(await response.json());
+        }
+    }
+
+    async function post(url, options) {
+        const response = await fetch(url, Object.assign({ credentials: 'same-origin' }, options));
+        const data = await response.json();
+        if (data.popup) {
+            alert(data.message || data.error);
+        }
+        return { response, data };
+    }
+
+    document.addEventListener('submit', async (e) => {
+        const form = e.target;
+        if (form.matches('[data-cart-add]')) {
+            e.preventDefault();
+            const { response, data } = await post(form.action, { method: 'POST', body: new FormData(form) });
+            if (response.ok && data.added) {
+                const count = cachedCount();
+                if (count === null) {
+                    refresh();
+                } else {
+                    setCount(count + data.added.quantity);
+                }
+            }
+        } else if (form.matches('[data-cart-remove]')) {
+            e.preventDefault();
+            const { response, data } = await post(form.action, { method: 'POST', body: new FormData(form) });
+            if (response.ok && data.cart) {
+                render(data.cart);
+            }
+        }
+    });
+
+    document.addEventListener('click', async (e) => {
+        const link = e.target.closest('[data-cart-clear]');
+        if (!link) {
+            return;
+        }
+        e.preventDefault();
+        const { response, data } = await post(link.href, { method: 'GET' });
+        if (response.ok && data.cart) {
+            render(data.cart);
+        }
+    });
+
+    document.addEventListener('DOMContentLoaded', () => {
+        // The cart page is rendered with fresh server state; elsewhere reuse the cached count if we have one
+        const page = document.querySelector('[data-cart-lines]');
+        if (page) {
+            setCount(Number(page.dataset.cartCount || 0));
+        } else if (cachedCount() === null) {
+            refresh();
+        } else {
+            setCount(cachedCount());
+        }
+    });
+
+    window.Cart = { render, refresh, setCount };
+})();
@@ -0,0 +1,593 @@
+import contextlib
+import copy
+import datetime
+import json
+import queue
+import sqlite3
+import threading
+import time
+import uuid
+
+
+# A cart is one aggregate per visitor:
+#   {"lines": {product_id: {"product_id", "name", "amount", "quantity", "total"}},
+#    "count": <items>, "total": <rand>, "updated_at": <epoch seconds>}
+def empty_cart():
+    return {"lines": {}, "count": 0, "total": 0.0, "updated_at": None}
+
+
+def cart_line(product, quantity):
+    return {
+        "product_id": product["id"],
+        "name": product["name"],
+        "amount": product["price"],
+        "quantity": quantity,
+        "total": product["price"] * quantity,
+    }
+
+
+# Recompute count/total from the lines so the stored aggregate stays consistent
+def summarize_cart(cart):
+    lines = cart.get("lines") or {}
+    cart["count"] = sum(line["quantity"] for line in lines.values())
+    cart["total"] = round(sum(line["total"] for line in lines.values()), 2)
+    return cart
+
+
+def cart_items(cart):
+    return list(cart["lines"].values())
+
+
+# Orders are numbered from one shared, persistent sequence: #0001, #0002, ...
+def format_order_number(sequence):
+    return f"#{sequence:04d}"
+
+
+def order_record(order, idempotency_key, sequence):
+    return dict(order, idempotency_key=idempotency_key, sequence=sequence, order_number=format_order_number(sequence))
+
+
+# Carts untouched for longer than this are stale and get expired instead of wiped at startup
+CART_TTL = 7 * 24 * 3600
+
+
+def cart_expired(cart, ttl, now=None):
+    updated_at = cart.get("updated_at")
+    return updated_at is not None and updated_at + ttl < (now if now is not None else time.time())
+
+
+class Storage:
+    # Optional callable(backend, operation, seconds), invoked for every backend round-trip (a
+    # Firestore RPC, a transaction attempt's begin and commit, or an SQLite statement batch) and
+    # for the lazy client creation; app.py feeds it into /metrics.
+    backend = None
+    observer = None
+
+    @contextlib.contextmanager
+    def _timed(self, operation):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._observe(operation, time.perf_counter() - started)
+
+    def _observe(self, operation, seconds):
+        if self.observer is not None:
+            self.observer(self.backend, operation, seconds)
+
+    def get_cart(self, cart_id):
+        raise NotImplementedError
+
+    # Merge quantity into the product's line; returns the updated line
+    def add_to_cart(self, cart_id, product, quantity):
+        raise NotImplementedError
+
+    # Drop a line; returns the updated cart, or None if the product was not in the cart
+    def remove_from_cart(self, cart_id, product_id):
+        raise NotImplementedError
+
+    def clear_cart(self, cart_id):
+        raise NotImplementedError
+
+    # Delete carts whose TTL has passed; returns how many were removed
+    def expire_carts(self, now=None):
+        raise NotImplementedError
+
+    # Order ledger: atomically allocate the next order number and record the order under its
+    # idempotency key. Returns (order, created); a repeated key returns the original order
+    # with created=False, so a double-submitted checkout never places two orders.
+    def place_order(self, idempotency_key, order):
+        raise NotImplementedError
+
+    # Checkout: like place_order, but the cart is read, turned into the order by
+    # build_order(cart) and deleted all in one transaction, so a line added meanwhile is either
+    # ordered or left in the cart, never lost. build_order returns None for a cart with nothing
+    # to order, in which case (None, False) is returned and nothing is written. It must have no
+    # side effects: Firestore runs it again when the transaction retries.
+    def place_cart_order(self, idempotency_key, cart_id, build_order):
+        raise NotImplementedError
+
+    def get_order(self, idempotency_key):
+        raise NotImplementedError
+
+    # Join requests and contacts are append-only records; each add returns the new ID
+
+    def add_join_request(self, join_request):
+        raise NotImplementedError
+
+    def add_contact(self, contact):
+        raise NotImplementedError
+
+
+# Firestore: one document per cart in the `carts` collection. The client is created on
+# first use, so importing the app costs no credentials load or network round-trip.
+# Cart documents carry an `expires_at` timestamp for a Firestore TTL policy.
+class FirestoreStorage(Storage):
+    backend = 'firestore'
+    # Firestore caps a batched write (and a transaction) at 500 operations
+    BATCH_LIMIT = 500
+    SWEEP_PAGE_SIZE = BATCH_LIMIT
+
+    def __init__(self, db=None, client_factory=None, cart_ttl=CART_TTL):
+        self._db = db
+        self._client_factory = client_factory
+        self._db_lock = threading.Lock()
+        self.cart_ttl = cart_ttl
+
+    @property
+    def db(self):
+        if self._db is None:
+            with self._db_lock:
+                if self._db is None:
+                    with self._timed('connect'):
+                        self._db = self._client_factory()
+        return self._db
+
+    def _cart_ref(self, cart_id):
+        return self.db.collection('carts').document(cart_id)
+
+    # Run function(transaction) in a Firestore transaction. Its reads are timed as 'read' where
+    # they happen; each run of it (Firestore reruns it on contention) is one 'transaction_attempt',
+    # timed until the next run or the end, which covers the attempt's begin and commit RPCs.
+    def _run_transaction(self, function):
+        from firebase_admin import firestore
+        started = []
+
+        def end_attempt():
+            if started:
+                self._observe('transaction_attempt', time.perf_counter() - started[-1])
+
+        @firestore.transactional
+        def attempt(transaction):
+            end_attempt()
+            started.append(time.perf_counter())
+            return function(transaction)
+
+        try:
+            return attempt(self.db.transaction())
+        finally:
+            end_attempt()
+
+    def _read(self, reference, transaction):
+        with self._timed('read'):
+            return reference.get(transaction=transaction)
+
+    def get_cart(self, cart_id):
+        with self._timed('read'):
+            snapshot = self._cart_ref(cart_id).get()
+        return self._cart_from_snapshot(snapshot)
+
+    def _cart_from_snapshot(self, snapshot):
+        if not snapshot.exists:
+            return empty_cart()
+        cart = empty_cart()
+        cart.update(snapshot.to_dict())
+        cart.pop("expires_at", None)
+        if cart_expired(cart, self.cart_ttl):
+            return empty_cart()
+        cart["total"] = round(cart["total"], 2)
+        return cart
+
+    def add_to_cart(self, cart_id, product, quantity):
+        # A single merge write; the increments are applied server-side so concurrent adds don't race
+        from firebase_admin import firestore
+        increment = firestore.Increment
+        line = cart_line(product, quantity)
+        now = time.time()
+        update = {
+            "lines": {product["id"]: {
+                "product_id": line["product_id"],
+                "name": line["name"],
+                "amount": line["amount"],
+                "quantity": increment(quantity),
+                "total": increment(line["total"]),
+            }},
+            "count": increment(quantity),
+            "total": increment(line["total"]),
+            "updated_at": now,
+            "expires_at": datetime.datetime.fromtimestamp(now + self.cart_ttl, datetime.timezone.utc),
+        }
+        with self._timed('write'):
+            self._cart_ref(cart_id).set(update, merge=True)
+        return line
+
+    def remove_from_cart(self, cart_id, product_id):
+        cart_ref = self._cart_ref(cart_id)
+
+        def remove(transaction):
+            snapshot = self._read(cart_ref, transaction)
+            cart = snapshot.to_dict() if snapshot.exists else None
+            if not cart or product_id not in cart.get("lines", {}):
+                return None
+            del cart["lines"][product_id]
+            cart["updated_at"] = time.time()
+            cart["expires_at"] = datetime.datetime.fromtimestamp(cart["updated_at"] + self.cart_ttl, datetime.timezone.utc)
+            transaction.set(cart_ref, summarize_cart(cart))
+            del cart["expires_at"]
+            return cart
+
+        return self._run_transaction(remove)
+
+    def clear_cart(self, cart_id):
+        with self._timed('delete'):
+            self._cart_ref(cart_id).delete()
+
+    # Backstop for the TTL policy, which may lag by up to a day: delete expired carts page by page
+    def expire_carts(self, now=None):
+        cutoff = datetime.datetime.fromtimestamp(now if now is not None else time.time(), datetime.timezone.utc)
+        query = self.db.collection('carts').where('expires_at', '<', cutoff).limit(self.SWEEP_PAGE_SIZE)
+        removed = 0
+        while True:
+            with self._timed('query'):
+                snapshots = list(query.get())
+            if not snapshots:
+                return removed
+            self._delete_in_batches(snapshot.reference for snapshot in snapshots)
+            removed += len(snapshots)
+
+    # One batched write per BATCH_LIMIT references instead of one delete RPC each
+    def _delete_in_batches(self, references):
+        batch, pending = self.db.batch(), 0
+        for reference in references:
+            batch.delete(reference)
+            pending += 1
+            if pending == self.BATCH_LIMIT:
+                with self._timed('batch'):
+                    batch.commit()
+                batch, pending = self.db.batch(), 0
+        if pending:
+            with self._timed('batch'):
+                batch.commit()
+
+    def _add(self, collection, record):
+        doc_ref = self.db.collection(collection).document()
+        with self._timed('write'):
+            doc_ref.set(record)
+        return doc_ref.id
+
+    # The sequence lives in counters/orders and is bumped inside the same transaction that
+    # creates orders/<idempotency_key>; Firestore retries the transaction on contention.
+    def place_order(self, idempotency_key, order):
+        return self._place_order(idempotency_key, lambda transaction: order)
+
+    # The cart is read in the transaction, so a concurrent write to it makes the commit fail and
+    # the whole transaction (cart read included) retry; its delete rides in the same commit
+    def place_cart_order(self, idempotency_key, cart_id, build_order):
+        cart_ref = self._cart_ref(cart_id)
+
+        def cart_order(transaction):
+            return build_order(self._cart_from_snapshot(self._read(cart_ref, transaction)))
+
+        return self._place_order(idempotency_key, cart_order, cart_ref)
+
+    def _place_order(self, idempotency_key, make_order, cart_ref=None):
+        order_ref = self.db.collection('orders').document(idempotency_key)
+        counter_ref = self.db.collection('counters').document('orders')
+
+        def place(transaction):
+            # All reads come before the writes, as Firestore transactions require
+            existing = self._read(order_ref, transaction)
+            if existing.exists:
+                return existing.to_dict(), False
+            order = make_order(transaction)
+            if order is None:
+                return None, False
+            counter = self._read(counter_ref, transaction)
+            sequence = (counter.to_dict() or {}).get("value", 0) + 1 if counter.exists else 1
+            record = order_record(order, idempotency_key, sequence)
+            transaction.set(counter_ref, {"value": sequence})
+            transaction.create(order_ref, record)
+            if cart_ref is not None:
+                transaction.delete(cart_ref)
+            return record, True
+
+        return self._run_transaction(place)
+
+    def get_order(self, idempotency_key):
+        with self._timed('read'):
+            snapshot = self.db.collection('orders').document(idempotency_key).get()
+        return snapshot.to_dict() if snapshot.exists else None
+
+    def add_join_request(self, join_request):
+        return self._add('join_requests', join_request)
+
+    def add_contact(self, contact):
+        return self._add('contacts', contact)
+
+
+# In-process store for local development
+class MemoryStorage(Storage):
+    backend = 'memory'
+
+    def __init__(self, cart_ttl=CART_TTL):
+        self.cart_ttl = cart_ttl
+        self._lock = threading.Lock()
+        self._carts = {}
+        self._records = {"join_requests": {}, "contacts": {}}
+        self._orders = {}
+        self._order_sequence = 0
+
+    def get_cart(self, cart_id):
+        with self._lock:
+            cart = self._carts.get(cart_id)
+            if not cart or cart_expired(cart, self.cart_ttl):
+                return empty_cart()
+            return copy.deepcopy(cart)
+
+    def add_to_cart(self, cart_id, product, quantity):
+        line = cart_line(product, quantity)
+        with self._lock:
+            cart = self._carts.get(cart_id)
+            if not cart or cart_expired(cart, self.cart_ttl):
+                cart = self._carts[cart_id] = empty_cart()
+            existing = cart["lines"].get(product["id"])
+            if existing:
+                existing["quantity"] += quantity
+                existing["total"] += line["total"]
+            else:
+                cart["lines"][product["id"]] = dict(line)
+            cart["updated_at"] = time.time()
+            summarize_cart(cart)
+        return line
+
+    def remove_from_cart(self, cart_id, product_id):
+        with self._lock:
+            cart = self._carts.get(cart_id)
+            if not cart or product_id not in cart["lines"]:
+                return None
+            del cart["lines"][product_id]
+            cart["updated_at"] = time.time()
+            summarize_cart(cart)
+            return copy.deepcopy(cart)
+
+    def clear_cart(self, cart_id):
+        with self._lock:
+            self._carts.pop(cart_id, None)
+
+    def expire_carts(self, now=None):
+        with self._lock:
+            expired = [cart_id for cart_id, cart in self._carts.items() if cart_expired(cart, self.cart_ttl, now)]
+            for cart_id in expired:
+                del self._carts[cart_id]
+        return len(expired)
+
+    def _add(self, collection, record):
+        record_id = uuid.uuid4().hex
+        with self._lock:
+            self._records[collection][record_id] = copy.deepcopy(record)
+        return record_id
+
+    def place_order(self, idempotency_key, order):
+        with self._lock:
+            return self._place_order(idempotency_key, lambda: order)
+
+    def place_cart_order(self, idempotency_key, cart_id, build_order):
+        def cart_order():
+            cart = self._carts.get(cart_id)
+            return build_order(empty_cart() if not cart or cart_expired(cart, self.cart_ttl) else copy.deepcopy(cart))
+
+        with self._lock:
+            order, created = self._place_order(idempotency_key, cart_order)
+            if created:
+                self._carts.pop(cart_id, None)
+            return order, created
+
+    # Caller holds the lock
+    def _place_order(self, idempotency_key, make_order):
+        existing = self._orders.get(idempotency_key)
+        if existing:
+            return copy.deepcopy(existing), False
+        order = make_order()
+        if order is None:
+            return None, False
+        self._order_sequence += 1
+        record = self._orders[idempotency_key] = copy.deepcopy(order_record(order, idempotency_key, self._order_sequence))
+        return copy.deepcopy(record), True
+
+    def get_order(self, idempotency_key):
+        with self._lock:
+            order = self._orders.get(idempotency_key)
+            return copy.deepcopy(order) if order else None
+
+    def add_join_request(self, join_request):
+        return self._add('join_requests', join_request)
+
+    def add_contact(self, contact):
+        return self._add('contacts', contact)
+
+
+# SQLite in WAL mode behind a small connection pool; carts are stored as JSON documents
+class SqliteStorage(Storage):
+    backend = 'sqlite'
+    RECORD_TABLES = ('join_requests', 'contacts')
+
+    def __init__(self, path, pool_size=4, timeout=30, cart_ttl=CART_TTL):
+        self.cart_ttl = cart_ttl
+        if path == ':memory:':
+            # An in-memory database only exists inside its one connection
+            pool_size = 1
+        self.path = path
+        self.timeout = timeout
+        self._pool = queue.LifoQueue()
+        self._pool_size = pool_size
+        self._created = 0
+        self._pool_lock = threading.Lock()
+        with self._connection() as conn:
+            conn.execute("CREATE TABLE IF NOT EXISTS carts (cart_id TEXT PRIMARY KEY, data TEXT NOT NULL, updated_at REAL NOT NULL)")
+            conn.execute("CREATE INDEX IF NOT EXISTS carts_updated_at ON carts (updated_at)")
+            for table in self.RECORD_TABLES:
+                conn.execute(f"CREATE TABLE IF NOT EXISTS {table} (id TEXT PRIMARY KEY, data TEXT NOT NULL, created_at REAL NOT NULL)")
+            conn.execute("CREATE TABLE IF NOT EXISTS counters (name TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS orders (idempotency_key TEXT PRIMARY KEY, sequence INTEGER NOT NULL UNIQUE, "
+                "data TEXT NOT NULL, created_at REAL NOT NULL)"
+            )
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=self.timeout, check_same_thread=False, isolation_level=None)
+        if self.path != ':memory:':
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    @contextlib.contextmanager
+    def _connection(self, operation=None):
+        if operation is not None:
+            with self._timed(operation), self._connection() as conn:
+                yield conn
+            return
+        try:
+            conn = self._pool.get_nowait()
+        except queue.Empty:
+            with self._pool_lock:
+                create = self._created < self._pool_size
+                if create:
+                    self._created += 1
+            conn = self._connect() if create else self._pool.get()
+        try:
+            yield conn
+        finally:
+            self._pool.put(conn)
+
+    @contextlib.contextmanager
+    def _transaction(self):
+        # BEGIN IMMEDIATE takes the write lock up front so read-modify-write cycles are atomic
+        with self._connection('transaction') as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield conn
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            conn.execute("COMMIT")
+
+    def _read_cart(self, conn, cart_id):
+        row = conn.execute("SELECT data FROM carts WHERE cart_id = ?", (cart_id,)).fetchone()
+        if not row:
+            return None
+        cart = json.loads(row[0])
+        return None if cart_expired(cart, self.cart_ttl) else cart
+
+    def get_cart(self, cart_id):
+        with self._connection('read') as conn:
+            return self._read_cart(conn, cart_id) or empty_cart()
+
+    def add_to_cart(self, cart_id, product, quantity):
+        line = cart_line(product, quantity)
+        with self._transaction() as conn:
+            cart = self._read_cart(conn, cart_id) or empty_cart()
+            existing = cart["lines"].get(product["id"])
+            if existing:
+                existing["quantity"] += quantity
+                existing["total"] += line["total"]
+            else:
+                cart["lines"][product["id"]] = dict(line)
+            cart["updated_at"] = time.time()
+            summarize_cart(cart)
+            conn.execute(
+                "INSERT OR REPLACE INTO carts (cart_id, data, updated_at) VALUES (?, ?, ?)",
+                (cart_id, json.dumps(cart), cart["updated_at"]),
+            )
+        return line
+
+    def remove_from_cart(self, cart_id, product_id):
+        with self._transaction() as conn:
+            cart = self._read_cart(conn, cart_id)
+            if not cart or product_id not in cart["lines"]:
+                return None
+            del cart["lines"][product_id]
+            cart["updated_at"] = time.time()
+            summarize_cart(cart)
+            conn.execute(
+                "UPDATE carts SET data = ?, updated_at = ? WHERE cart_id = ?",
+                (json.dumps(cart), cart["updated_at"], cart_id),
+            )
+            return cart
+
+    def clear_cart(self, cart_id):
+        with self._connection('delete') as conn:
+            conn.execute("DELETE FROM carts WHERE cart_id = ?", (cart_id,))
+
+    def expire_carts(self, now=None):
+        cutoff = (now if now is not None else time.time()) - self.cart_ttl
+        with self._connection('delete') as conn:
+            return conn.execute("DELETE FROM carts WHERE updated_at < ?", (cutoff,)).rowcount
+
+    def _add(self, table, record):
+        record_id = uuid.uuid4().hex
+        with self._connection('write') as conn:
+            conn.execute(f"INSERT INTO {table} (id, data, created_at) VALUES (?, ?, ?)",
+                         (record_id, json.dumps(record), time.time()))
+        return record_id
+
+    # The counter row is bumped under BEGIN IMMEDIATE, which serializes writers across processes
+    def place_order(self, idempotency_key, order):
+        with self._transaction() as conn:
+            return self._place_order(conn, idempotency_key, lambda: order)
+
+    # The cart is read under the same write lock that deletes it
+    def place_cart_order(self, idempotency_key, cart_id, build_order):
+        with self._transaction() as conn:
+            order, created = self._place_order(conn, idempotency_key, lambda: build_order(self._read_cart(conn, cart_id) or empty_cart()))
+            if created:
+                conn.execute("DELETE FROM carts WHERE cart_id = ?", (cart_id,))
+            return order, created
+
+    def _place_order(self, conn, idempotency_key, make_order):
+        row = conn.execute("SELECT data FROM orders WHERE idempotency_key = ?", (idempotency_key,)).fetchone()
+        if row:
+            return json.loads(row[0]), False
+        order = make_order()
+        if order is None:
+            return None, False
+        conn.execute("INSERT OR IGNORE INTO counters (name, value) VALUES ('orders', 0)")
+        conn.execute("UPDATE counters SET value = value + 1 WHERE name = 'orders'")
+        sequence = conn.execute("SELECT value FROM counters WHERE name = 'orders'").fetchone()[0]
+        record = order_record(order, idempotency_key, sequence)
+        conn.execute(
+            "INSERT INTO orders (idempotency_key, sequence, data, created_at) VALUES (?, ?, ?, ?)",
+            (idempotency_key, sequence, json.dumps(record), time.time()),
+        )
+        return record, True
+
+    def get_order(self, idempotency_key):
+        with self._connection('read') as conn:
+            row = conn.execute("SELECT data FROM orders WHERE idempotency_key = ?", (idempotency_key,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def add_join_request(self, join_request):
+        return self._add('join_requests', join_request)
+
+    def add_contact(self, contact):
+        return self._add('contacts', contact)
+
+
+# Build a backend by name: "firestore" needs a client or a factory for one, "sqlite" a database path
+def create_storage(backend, db=None, client_factory=None, sqlite_path=None, cart_ttl=CART_TTL):
+    if backend == 'firestore':
+        return FirestoreStorage(db, client_factory=client_factory, cart_ttl=cart_ttl)
+    if backend == 'sqlite':
+        return SqliteStorage(sqlite_path or 'forever-zama.sqlite3', cart_ttl=cart_ttl)
+    if backend == 'memory':
+        return MemoryStorage(cart_ttl=cart_ttl)
+    raise ValueError(f"Unknown storage backend '{backend}'")